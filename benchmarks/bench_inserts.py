@@ -0,0 +1,67 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import create_connection, migrate, create_device, create_history, create_devices, create_histories
+
+
+def generate_devices(n):
+    return [(f"Device {i}", 5 + i % 2000) for i in range(n)]
+
+
+def generate_histories(n, devices):
+    start = datetime(2020, 1, 1)
+    return [(start + timedelta(minutes=i), [(1 + (i + j) % devices, 1 + j, 1 + i % 24) for j in range(5)])
+            for i in range(n)]
+
+
+def run(label, conn, devices, histories, batched):
+    migrate(conn)
+
+    start = time.perf_counter()
+    if batched:
+        create_devices(conn, devices)
+    else:
+        for device in devices:
+            create_device(conn, device)
+    devices_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if batched:
+        create_histories(conn, histories)
+    else:
+        for history in histories:
+            create_history(conn, history)
+    history_elapsed = time.perf_counter() - start
+
+    conn.close()
+    print(f"{label:<34} devices: {len(devices) / devices_elapsed:>10.0f}/s"
+          f"   history: {len(histories) / history_elapsed:>10.0f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare insert throughput of the SQLite layer.")
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=2000)
+    args = parser.parse_args()
+
+    devices = generate_devices(args.devices)
+    histories = generate_histories(args.history, args.devices)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # the layer as it was: rollback journal, synchronous=FULL, one commit per row
+        conn = sqlite3.connect(os.path.join(directory, "before.db"))
+        conn.execute("PRAGMA foreign_keys = ON")
+        run("rollback journal, commit per row", conn, devices, histories, batched=False)
+
+        run("WAL, commit per row", create_connection(os.path.join(directory, "wal.db")),
+            devices, histories, batched=False)
+        run("WAL, batched", create_connection(os.path.join(directory, "batched.db")),
+            devices, histories, batched=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import time
+
+import numpy as np
+
+from load_profile import simulate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the load curve simulator over a year of schedules.")
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--resolution", type=int, nargs="+", default=[60, 15, 1], help="minutes per slot")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = [(i, f"Device {i}", int(rng.integers(5, 3000)), int(rng.integers(1, 4)), int(rng.integers(1, 24)))
+            for i in range(args.devices)]
+    # half of the devices get a schedule, the rest run their hours from midnight
+    schedules = {i: [(int(rng.integers(0, 1440)), int(rng.integers(0, 1441)), int(rng.integers(1, 128)),
+                      float(rng.random()), int(rng.integers(0, 60)))]
+                 for i in range(0, args.devices, 2)}
+
+    for resolution in args.resolution:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            curve = simulate(rows, schedules, args.days, resolution)
+            timings.append(time.perf_counter() - start)
+        print(f"{args.devices} devices x {args.days} days at {resolution:>2} min: {min(timings) * 1000:>8.1f} ms"
+              f"   peak {curve.peak_kw:.1f} kW, load factor {curve.load_factor:.3f},"
+              f" coincidence {curve.coincidence_factor:.3f}")
+
+
+if __name__ == "__main__":
+    main()
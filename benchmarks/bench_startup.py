@@ -0,0 +1,44 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+# keep Kivy from parsing this script's arguments
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+
+
+def phase(timings, name, func):
+    start = time.perf_counter()
+    result = func()
+    timings.append((name, time.perf_counter() - start))
+    return result
+
+
+def main():
+    timings = []
+    # main.py opens database.db in the working directory, run it against an empty one
+    sys.path.insert(0, os.path.abspath(sys.path[0]))
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+
+        phase(timings, "import kivy", lambda: importlib.import_module("kivy"))
+        phase(timings, "create window", lambda: importlib.import_module("kivy.core.window"))
+        app_module = phase(timings, "import main", lambda: importlib.import_module("main"))
+
+        app = app_module.MyApp()
+        phase(timings, "build (home screen)", app.build)
+        phase(timings, "database schema ready", lambda: app_module.db_worker.submit(lambda connection: None).result())
+        for name in app_module.screen_classes:
+            if name != "home":
+                phase(timings, f"first visit: {name}", lambda: app_module.get_screen(name))
+        phase(timings, "first calculation (numpy)", lambda: importlib.import_module("calculation"))
+
+        app_module.db_worker.stop()
+
+    for name, elapsed in timings:
+        print(f"{name:<28} {elapsed * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
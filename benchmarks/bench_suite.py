@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_inserts import generate_devices, generate_histories
+from calculation import compute_consumption, compute_consumption_batch, row_consumption
+from database import (create_connection, migrate, create_devices, create_histories, create_favourites,
+                      create_history, select_all_history)
+from record_cache import select_record
+
+
+def generate_favourites(n, devices):
+    return [(f"Favourite {i}", rows) for i, (name, rows) in enumerate(generate_histories(n, devices))]
+
+
+def measure(repeat, func):
+    # best of `repeat` runs, the minimum is the least disturbed by the rest of the machine
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def result(scale, operation, seconds, items):
+    return {"scale": scale,
+            "operation": operation,
+            "seconds": round(seconds, 6),
+            "items": items,
+            "per_second": round(items / seconds, 1) if seconds else None}
+
+
+def run_scale(directory, scale, sample, repeat):
+    results = []
+    conn = create_connection(os.path.join(directory, f"database_{scale}.db"))
+    migrate(conn)
+
+    devices = generate_devices(scale)
+    histories = generate_histories(scale, scale)
+    favourites = generate_favourites(scale, scale)
+    history_rows = sum(len(rows) for name, rows in histories)
+
+    start = time.perf_counter()
+    create_devices(conn, devices)
+    results.append(result(scale, "insert_devices", time.perf_counter() - start, len(devices)))
+
+    start = time.perf_counter()
+    create_histories(conn, histories)
+    results.append(result(scale, "insert_history", time.perf_counter() - start, history_rows))
+
+    start = time.perf_counter()
+    create_favourites(conn, favourites)
+    results.append(result(scale, "insert_favourites", time.perf_counter() - start,
+                          sum(len(rows) for name, rows in favourites)))
+
+    results.append(result(scale, "select_all_history", measure(repeat, lambda: select_all_history(conn)), scale))
+
+    rng = random.Random(scale)
+    picked = rng.sample(range(scale), min(sample, scale))
+
+    # save() stores every calculation in history, records already there are dropped by the data_hash conflict
+    duplicates = [histories[i] for i in picked]
+    results.append(result(scale, "history_dedup", measure(repeat, lambda: [create_history(conn, history)
+                                                                           for history in duplicates]),
+                          len(duplicates)))
+
+    # what the worker runs when a record is opened: its rows, their kWh and the content hash
+    history_ids = [i + 1 for i in picked]
+    results.append(result(scale, "record_parse", measure(repeat, lambda: [select_record(conn, "history", i)
+                                                                          for i in history_ids]),
+                          len(history_ids)))
+
+    cur = conn.cursor()
+    cur.execute(''' SELECT history_rows.history_id, history_rows.count, history_rows.hours, devices.power
+                    FROM history_rows JOIN devices ON devices.id = history_rows.device_id ''')
+    set_index, count, hours, power = (np.array(column, dtype=np.float64) for column in zip(*cur.fetchall()))
+    conn.close()
+
+    results.append(result(scale, "kwh_compute", measure(repeat, lambda: compute_consumption(count, hours, power)),
+                          len(count)))
+    results.append(result(scale, "kwh_compute_batch",
+                          measure(repeat, lambda: compute_consumption_batch(set_index, count, hours, power)),
+                          len(count)))
+    rows = list(zip(count.tolist(), hours.tolist(), power.tolist()))[:sample]
+    results.append(result(scale, "kwh_row", measure(repeat, lambda: [row_consumption(*row) for row in rows]),
+                          len(rows)))
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    before = {(entry["scale"], entry["operation"]): entry["seconds"] for entry in baseline["results"]}
+
+    for entry in report["results"]:
+        previous = before.get((entry["scale"], entry["operation"]))
+        if previous and entry["seconds"]:
+            print(f"{entry['operation']:<20} {entry['scale']:>8} {previous:>10.4f}s -> {entry['seconds']:>10.4f}s"
+                  f"   x{previous / entry['seconds']:.2f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the database and calculation layers and print JSON.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="number of devices, history records and favourites to generate (up to 1000000)")
+    parser.add_argument("--sample", type=int, default=1000, help="records used by the per-record operations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--compare", help="JSON from an earlier run, speedups are printed to stderr")
+    args = parser.parse_args()
+
+    report = {"commit": git_commit(),
+              "python": sys.version.split()[0],
+              "sqlite": sqlite3.sqlite_version,
+              "numpy": np.__version__,
+              "machine": platform.machine(),
+              "results": []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            report["results"].extend(run_scale(directory, scale, args.sample, args.repeat))
+
+    if args.compare:
+        compare(report, args.compare)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
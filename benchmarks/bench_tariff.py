@@ -0,0 +1,46 @@
+import argparse
+import time
+
+import numpy as np
+
+from tariff import Tariff, daily_load
+
+weekdays = 0b0011111
+weekend = 0b1100000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the cost engine over a year of hourly tariff bands.")
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    count = rng.integers(1, 10, args.devices)
+    hours = rng.integers(1, 24, args.devices)
+    power = rng.integers(5, 3000, args.devices)
+    start_hour = rng.integers(0, 24, args.devices)
+
+    tariff = Tariff("benchmark", "time_of_use", 0.25,
+                    bands=[(23, 7, 0.12, 127), (7, 17, 0.28, weekdays), (17, 21, 0.45, weekdays),
+                           (9, 18, 0.2, weekend)])
+
+    def best(func):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    elapsed = best(lambda: tariff.cost(count, hours, power, args.days, start_hour))
+    print(f"daily profiles, {args.devices} devices x {args.days} days: {elapsed * 1000:.1f} ms")
+
+    load = np.tile(daily_load(count, hours, power, start_hour), args.days)
+    elapsed = best(lambda: tariff.load_cost(load))
+    print(f"hourly load curve, {load.shape[0]} x {load.shape[1]} hours: {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
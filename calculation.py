@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def compute_consumption(count, hours, power):
+    count = np.asarray(count, dtype=np.float64)
+    hours = np.asarray(hours, dtype=np.float64)
+    power = np.asarray(power, dtype=np.float64)
+
+    rows = count * hours * power / 1000
+
+    return rows, float(rows.sum())
+
+
+def row_consumption(count, hours, power):
+    # scalar version of compute_consumption for updating one row at a time
+    return count * hours * power / 1000
+
+
+def compute_consumption_batch(set_index, count, hours, power, sets=None):
+    rows, _ = compute_consumption(count, hours, power)
+    set_index = np.asarray(set_index, dtype=np.intp)
+    totals = np.bincount(set_index, weights=rows, minlength=sets or 0)
+
+    return rows, totals
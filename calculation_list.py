@@ -0,0 +1,103 @@
+from functools import partial
+
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.core.window import Window
+
+from widgets import MyTextInput, SpinnerWidget
+
+# imported by the calculation screen when it is first built, not at startup
+
+
+class CalculationRow(RecycleDataViewBehavior, BoxLayout):
+    # rows made so far, RecycleView keeps the ones out of view for reuse
+    made = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        CalculationRow.made += 1
+        self.index = 0
+        self.calculation_list = None
+        self.row = None
+        self.spacing = 10
+
+        self.input_count = MyTextInput(halign="center",
+                                       size_hint_x=None,
+                                       width=Window.size[0]/8)
+        self.add_widget(self.input_count)
+
+        self.input_hours = MyTextInput(halign="center",
+                                       size_hint_x=None,
+                                       width=Window.size[0]/8)
+        self.add_widget(self.input_hours)
+
+        self.spinner_device = SpinnerWidget(size_hint_x=None,
+                                            width=Window.size[0]/3)
+        self.add_widget(self.spinner_device)
+
+        self.btn_remove = Button(text="x",
+                                 size_hint_x=None,
+                                 width=Window.size[0]/6,
+                                 on_press=self.remove_row)
+        self.add_widget(self.btn_remove)
+
+        self.label_result = Label(size_hint_x=None,
+                                  width=Window.size[0]/6)
+        self.add_widget(self.label_result)
+
+        self.input_count.bind(text=partial(self.edit, "count"))
+        self.input_hours.bind(text=partial(self.edit, "hours"))
+        self.spinner_device.bind(text=partial(self.edit, "device"))
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.calculation_list = rv
+        # the row is swapped first, so the texts set below already match it and are not taken for edits
+        self.row = data
+        self.spinner_device.catalog = rv.catalog
+        self.spinner_device.filter_input = rv.filter_input
+        self.input_count.text = data["count"]
+        self.input_hours.text = data["hours"]
+        self.spinner_device.text = data["device"]
+        self.label_result.text = data["result"]
+
+    def edit(self, field, instance, value):
+        # typing changes the row's dict in place, the view may show another row once it is scrolled away
+        if self.row is not None and self.row[field] != value:
+            self.row[field] = value
+            self.calculation_list.row_edited(self.row)
+
+    def remove_row(self, instance):
+        self.calculation_list.remove_row(self.index)
+
+
+class CalculationList(RecycleView):
+    def __init__(self, catalog, filter_input, row_edited, row_removed, **kwargs):
+        super().__init__(**kwargs)
+        self.catalog = catalog
+        self.filter_input = filter_input
+        self.row_edited = row_edited
+        self.row_removed = row_removed
+
+        layout = RecycleBoxLayout(orientation="vertical",
+                                  spacing=10,
+                                  default_size=(None, Window.height / 20),
+                                  default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter("height"))
+        self.add_widget(layout)
+        self.viewclass = CalculationRow
+
+    def remove_row(self, index):
+        row = self.data.pop(index)
+        self.row_removed(row)
+
+    def view_count(self):
+        return CalculationRow.made
+
+    def rows_in_view(self):
+        return int(self.height // (Window.height / 20 + 10)) + 2
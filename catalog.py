@@ -0,0 +1,48 @@
+def device_label(name, power):
+    return f"{name} {power} W"
+
+
+class DeviceCatalog:
+    def __init__(self, devices=()):
+        self.devices = {}
+        self.by_label = {}
+        self.labels = []
+        # bumped on every change so views can tell whether their copy of the labels is stale
+        self.version = 0
+        self.load(devices)
+
+    def clear(self):
+        self.devices = {}
+        self.by_label = {}
+        self.labels = []
+        self.version += 1
+
+    def load(self, devices):
+        for device in devices:
+            self.add(device)
+
+    def add(self, device):
+        device_id, name, power = device
+        label = device_label(name, power)
+        if label not in self.by_label:
+            self.labels.append(label)
+        self.devices[device_id] = device
+        self.by_label[label] = device_id
+        self.version += 1
+
+    def get(self, label):
+        return self.devices[self.by_label[label]]
+
+    def search(self, text="", limit=None):
+        text = text.strip().lower()
+        if not text:
+            return self.labels[:limit]
+
+        matches = []
+        for label in self.labels:
+            if text in label.lower():
+                matches.append(label)
+                if len(matches) == limit:
+                    break
+
+        return matches
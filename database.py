@@ -0,0 +1,744 @@
+import hashlib
+import json
+import re
+import sqlite3
+from sqlite3 import Error
+
+from instrumentation import timed
+
+
+def create_connection(db_file):
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file, cached_statements=256)
+        conn.execute("PRAGMA foreign_keys = ON")
+        # only applies to new files, retention.vacuum converts existing ones
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL lets readers run alongside the writer, and with it NORMAL only syncs at checkpoints
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+    except Error as e:
+        print(e)
+
+    return conn
+
+
+def create_table(conn, create_table_sql):
+    try:
+        c = conn.cursor()
+        c.execute(create_table_sql)
+    except Error as e:
+        print(e)
+
+
+sql_create_devices_table = """ CREATE TABLE IF NOT EXISTS devices (
+                                    id integer PRIMARY KEY,
+                                    name text NOT NULL,
+                                    power integer
+                                ); """
+
+sql_create_history_table = """CREATE TABLE IF NOT EXISTS history (
+                                id integer PRIMARY KEY,
+                                name datetime,
+                                data text
+                            );"""
+
+
+sql_create_favourite_table = """CREATE TABLE IF NOT EXISTS favourite (
+                                id integer PRIMARY KEY,
+                                name text,
+                                data text
+                            );"""
+
+
+sql_create_history_rows_table = """CREATE TABLE IF NOT EXISTS history_rows (
+                                    id integer PRIMARY KEY,
+                                    history_id integer NOT NULL REFERENCES history(id) ON DELETE CASCADE,
+                                    device_id integer NOT NULL REFERENCES devices(id),
+                                    count integer NOT NULL,
+                                    hours integer NOT NULL
+                                );"""
+
+sql_create_favourite_rows_table = """CREATE TABLE IF NOT EXISTS favourite_rows (
+                                    id integer PRIMARY KEY,
+                                    favourite_id integer NOT NULL REFERENCES favourite(id) ON DELETE CASCADE,
+                                    device_id integer NOT NULL REFERENCES devices(id),
+                                    count integer NOT NULL,
+                                    hours integer NOT NULL
+                                );"""
+
+
+def record_hash(rows):
+    # rows are (device_id, count, hours) tuples in display order
+    content = ";".join(f"{device_id},{count},{hours}" for device_id, count, hours in rows)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def parse_legacy_record(data, labels=frozenset(), max_pipes=None):
+    # "<rows>|<count>|<hours>|<name> <power> W|...|" as written by versions before history_rows. Device names can
+    # contain "|", so rows are taken off the end, matching the known device label with the most "|" first. labels
+    # is a set, max_pipes the most "|" in any of them; callers parsing many records work both out once
+    if max_pipes is None:
+        max_pipes = max((label.count("|") for label in labels), default=0)
+    parts = (data[:-1] if data.endswith("|") else data).split("|")
+    row_count = int(parts[0])
+
+    rows = []
+    end = len(parts)
+    for i in range(row_count):
+        # the label ends at parts[end - 1]; the fewest parts it may start at leave room for row count, count, hours
+        start = end - 1
+        for pipes in range(min(max_pipes, end - 4), 0, -1):
+            if "|".join(parts[end - 1 - pipes:end]) in labels:
+                start = end - 1 - pipes
+                break
+        if start < 3:
+            raise ValueError(f"cannot read legacy record: {data!r}")
+        label = "|".join(parts[start:end])
+        count, hours = parts[start - 2], parts[start - 1]
+        end = start - 2
+        name, power, _ = label.rsplit(" ", 2)
+        rows.append((name, int(power), int(count), int(hours)))
+    if end != 1:
+        raise ValueError(f"cannot read legacy record: {data!r}")
+
+    rows.reverse()
+    return rows
+
+
+def migration_create_tables(conn):
+    create_table(conn, sql_create_devices_table)
+    create_table(conn, sql_create_history_table)
+    create_table(conn, sql_create_favourite_table)
+
+
+def migration_lookup_indexes(conn):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE history ADD COLUMN data_hash text")
+    cur.execute("SELECT id, data FROM history")
+    cur.executemany("UPDATE history SET data_hash=? WHERE id=?",
+                    [(hashlib.sha1((data or "").encode("utf-8")).hexdigest(), history_id)
+                     for history_id, data in cur.fetchall()])
+
+    # older versions could store the same record or favourite name more than once
+    cur.execute("DELETE FROM history WHERE id NOT IN (SELECT MIN(id) FROM history GROUP BY data_hash)")
+    cur.execute("DELETE FROM favourite WHERE id NOT IN (SELECT MIN(id) FROM favourite GROUP BY name)")
+
+    cur.execute("CREATE UNIQUE INDEX history_data_hash ON history(data_hash)")
+    cur.execute("CREATE INDEX history_name ON history(name)")
+    cur.execute("CREATE UNIQUE INDEX favourite_name ON favourite(name)")
+
+
+def migration_record_rows(conn):
+    create_table(conn, sql_create_history_rows_table)
+    create_table(conn, sql_create_favourite_rows_table)
+
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX history_rows_history_id ON history_rows(history_id)")
+    cur.execute("CREATE INDEX favourite_rows_favourite_id ON favourite_rows(favourite_id)")
+
+    cur.execute("SELECT id, name, power FROM devices ORDER BY id DESC")
+    device_ids = {(name, power): device_id for device_id, name, power in cur.fetchall()}
+    labels = {f"{name} {power} W" for name, power in device_ids}
+    max_pipes = max((label.count("|") for label in labels), default=0)
+
+    def resolve_rows(data):
+        # None when the record cannot be read
+        try:
+            legacy_rows = parse_legacy_record(data or "", labels, max_pipes)
+        except ValueError:
+            return None
+
+        rows = []
+        for name, power, count, hours in legacy_rows:
+            if (name, power) not in device_ids:
+                cur.execute("INSERT INTO devices(name,power) VALUES(?,?)", (name, power))
+                device_ids[(name, power)] = cur.lastrowid
+            rows.append((device_ids[(name, power)], count, hours))
+
+        return rows
+
+    # clear every hash first, records written differently may now normalize to the same content. Records that
+    # cannot be read keep their text in data and a hash of their own, so none of them is lost or merged
+    cur.execute("SELECT id, data FROM history ORDER BY id")
+    history = cur.fetchall()
+    cur.execute("UPDATE history SET data_hash=NULL")
+    seen = set()
+    for history_id, data in history:
+        rows = resolve_rows(data)
+        if rows is None:
+            cur.execute("UPDATE history SET data_hash=? WHERE id=?",
+                        (hashlib.sha1(f"legacy:{history_id}:{data}".encode("utf-8")).hexdigest(), history_id))
+            continue
+        data_hash = record_hash(rows)
+        if data_hash in seen:
+            cur.execute("DELETE FROM history WHERE id=?", (history_id,))
+            continue
+        seen.add(data_hash)
+        cur.execute("UPDATE history SET data_hash=?, data=NULL WHERE id=?", (data_hash, history_id))
+        cur.executemany("INSERT INTO history_rows(history_id,device_id,count,hours) VALUES(?,?,?,?)",
+                        [(history_id, *row) for row in rows])
+
+    cur.execute("SELECT id, data FROM favourite")
+    for favourite_id, data in cur.fetchall():
+        rows = resolve_rows(data)
+        if rows is None:
+            continue
+        cur.execute("UPDATE favourite SET data=NULL WHERE id=?", (favourite_id,))
+        cur.executemany("INSERT INTO favourite_rows(favourite_id,device_id,count,hours) VALUES(?,?,?,?)",
+                        [(favourite_id, *row) for row in rows])
+
+
+sql_create_history_daily_table = """CREATE TABLE IF NOT EXISTS history_daily (
+                                    day text NOT NULL,
+                                    device_id integer NOT NULL REFERENCES devices(id),
+                                    energy real NOT NULL,
+                                    PRIMARY KEY (day, device_id)
+                                ) WITHOUT ROWID;"""
+
+
+def migration_daily_summary(conn):
+    # per-day, per-device kWh kept up to date by triggers so reports never scan history_rows
+    create_table(conn, sql_create_history_daily_table)
+
+    cur = conn.cursor()
+    # history named other than by a date, e.g. imported from a favourites file, has no day to count towards
+    cur.execute(''' CREATE TRIGGER history_rows_daily_insert AFTER INSERT ON history_rows
+                    WHEN date((SELECT name FROM history WHERE id = NEW.history_id)) IS NOT NULL
+                    BEGIN
+                        INSERT INTO history_daily(day, device_id, energy)
+                        VALUES (date((SELECT name FROM history WHERE id = NEW.history_id)), NEW.device_id,
+                                NEW.count * NEW.hours * (SELECT power FROM devices WHERE id = NEW.device_id) / 1000.0)
+                        ON CONFLICT(day, device_id) DO UPDATE SET energy = energy + excluded.energy;
+                    END ''')
+    # rows go away through ON DELETE CASCADE, after their history row is gone, so subtract up front; days a device
+    # no longer has energy on are dropped so the summary does not keep deleted devices referenced
+    cur.execute(''' CREATE TRIGGER history_daily_delete BEFORE DELETE ON history
+                    BEGIN
+                        UPDATE history_daily
+                        SET energy = energy - (SELECT SUM(history_rows.count * history_rows.hours * devices.power)
+                                               FROM history_rows JOIN devices ON devices.id = history_rows.device_id
+                                               WHERE history_rows.history_id = OLD.id
+                                                 AND history_rows.device_id = history_daily.device_id) / 1000.0
+                        WHERE day = date(OLD.name)
+                          AND device_id IN (SELECT device_id FROM history_rows WHERE history_id = OLD.id);
+                        DELETE FROM history_daily
+                        WHERE day = date(OLD.name)
+                          AND device_id IN (SELECT device_id FROM history_rows WHERE history_id = OLD.id)
+                          AND energy < 1e-9;
+                    END ''')
+
+    cur.execute(''' INSERT INTO history_daily(day, device_id, energy)
+                    SELECT date(history.name), history_rows.device_id,
+                           SUM(history_rows.count * history_rows.hours * devices.power) / 1000.0
+                    FROM history
+                    JOIN history_rows ON history_rows.history_id = history.id
+                    JOIN devices ON devices.id = history_rows.device_id
+                    WHERE date(history.name) IS NOT NULL
+                    GROUP BY 1, 2 ''')
+
+
+sql_create_tariffs_table = """CREATE TABLE IF NOT EXISTS tariffs (
+                                id integer PRIMARY KEY,
+                                name text NOT NULL UNIQUE,
+                                kind text NOT NULL CHECK (kind IN ('flat', 'tiered', 'time_of_use')),
+                                rate real NOT NULL DEFAULT 0
+                            );"""
+
+sql_create_tariff_tiers_table = """CREATE TABLE IF NOT EXISTS tariff_tiers (
+                                    id integer PRIMARY KEY,
+                                    tariff_id integer NOT NULL REFERENCES tariffs(id) ON DELETE CASCADE,
+                                    up_to real,
+                                    rate real NOT NULL
+                                );"""
+
+sql_create_tariff_bands_table = """CREATE TABLE IF NOT EXISTS tariff_bands (
+                                    id integer PRIMARY KEY,
+                                    tariff_id integer NOT NULL REFERENCES tariffs(id) ON DELETE CASCADE,
+                                    start_hour integer NOT NULL,
+                                    end_hour integer NOT NULL,
+                                    rate real NOT NULL,
+                                    weekdays integer NOT NULL DEFAULT 127
+                                );"""
+
+
+def migration_tariffs(conn):
+    create_table(conn, sql_create_tariffs_table)
+    create_table(conn, sql_create_tariff_tiers_table)
+    create_table(conn, sql_create_tariff_bands_table)
+
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX tariff_tiers_tariff_id ON tariff_tiers(tariff_id)")
+    cur.execute("CREATE INDEX tariff_bands_tariff_id ON tariff_bands(tariff_id)")
+
+
+def migration_search_index(conn):
+    # one full-text document per record: its name and the names of its devices, rowid is the record id.
+    # insert_history/insert_favourite write the document once the rows are in, deletes are handled here
+    cur = conn.cursor()
+    for table in ("history", "favourite"):
+        cur.execute(f''' CREATE VIRTUAL TABLE {table}_search USING fts5(title, devices, prefix='2 3') ''')
+        cur.execute(f''' CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table}
+                         BEGIN
+                             DELETE FROM {table}_search WHERE rowid = OLD.id;
+                         END ''')
+        cur.execute(f''' INSERT INTO {table}_search(rowid, title, devices)
+                         SELECT {table}.id, {table}.name,
+                                coalesce((SELECT group_concat(devices.name, ' ')
+                                          FROM {table}_rows JOIN devices ON devices.id = {table}_rows.device_id
+                                          WHERE {table}_rows.{table}_id = {table}.id), '')
+                         FROM {table} ''')
+
+
+sql_create_device_schedules_table = """CREATE TABLE IF NOT EXISTS device_schedules (
+                                        id integer PRIMARY KEY,
+                                        device_id integer NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+                                        start_minute integer NOT NULL CHECK (start_minute BETWEEN 0 AND 1439),
+                                        end_minute integer NOT NULL CHECK (end_minute BETWEEN 0 AND 1440),
+                                        weekdays integer NOT NULL DEFAULT 127,
+                                        duty_cycle real NOT NULL DEFAULT 1 CHECK (duty_cycle BETWEEN 0 AND 1),
+                                        cycle_minutes integer NOT NULL DEFAULT 0
+                                    );"""
+
+
+def migration_device_schedules(conn):
+    # when each device runs, see load_profile.py; devices without a schedule use the row's hours
+    create_table(conn, sql_create_device_schedules_table)
+
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX device_schedules_device_id ON device_schedules(device_id)")
+
+
+sql_create_history_retention_table = """CREATE TABLE IF NOT EXISTS history_retention (
+                                        id integer PRIMARY KEY CHECK (id = 1),
+                                        keep_days integer,
+                                        rolled_up_before text NOT NULL DEFAULT ''
+                                    );"""
+
+
+def migration_retention(conn):
+    # history older than rolled_up_before only lives on in history_daily, see retention.py
+    create_table(conn, sql_create_history_retention_table)
+
+    cur = conn.cursor()
+    cur.execute("INSERT INTO history_retention(id) VALUES(1)")
+    # removing rolled-up entries must leave their share of the daily summary in place
+    cur.execute("DROP TRIGGER history_daily_delete")
+    cur.execute(''' CREATE TRIGGER history_daily_delete BEFORE DELETE ON history
+                    WHEN date(OLD.name) >= (SELECT rolled_up_before FROM history_retention)
+                    BEGIN
+                        UPDATE history_daily
+                        SET energy = energy - (SELECT SUM(history_rows.count * history_rows.hours * devices.power)
+                                               FROM history_rows JOIN devices ON devices.id = history_rows.device_id
+                                               WHERE history_rows.history_id = OLD.id
+                                                 AND history_rows.device_id = history_daily.device_id) / 1000.0
+                        WHERE day = date(OLD.name)
+                          AND device_id IN (SELECT device_id FROM history_rows WHERE history_id = OLD.id);
+                        DELETE FROM history_daily
+                        WHERE day = date(OLD.name)
+                          AND device_id IN (SELECT device_id FROM history_rows WHERE history_id = OLD.id)
+                          AND energy < 1e-9;
+                    END ''')
+
+
+sql_create_change_log_table = """CREATE TABLE IF NOT EXISTS change_log (
+                                    version integer PRIMARY KEY AUTOINCREMENT,
+                                    table_name text NOT NULL,
+                                    operation text NOT NULL CHECK (operation IN ('insert', 'delete')),
+                                    row_id integer NOT NULL,
+                                    payload text NOT NULL
+                                );"""
+
+sql_create_sync_state_table = """CREATE TABLE IF NOT EXISTS sync_state (
+                                    id integer PRIMARY KEY CHECK (id = 1),
+                                    client_id text NOT NULL,
+                                    pushed_version integer NOT NULL DEFAULT 0,
+                                    pulled_version integer NOT NULL DEFAULT 0,
+                                    applying integer NOT NULL DEFAULT 0
+                                );"""
+
+
+def migration_change_log(conn):
+    # devices and favourites changed on this install, for sync.py to push; changes pulled from other installs
+    # are applied with sync_state.applying set so they are not logged again. Versions never go back after the
+    # pushed part of the log is deleted, hence AUTOINCREMENT
+    create_table(conn, sql_create_change_log_table)
+    create_table(conn, sql_create_sync_state_table)
+
+    cur = conn.cursor()
+    cur.execute("INSERT INTO sync_state(id, client_id) VALUES(1, lower(hex(randomblob(16))))")
+    for operation, row in (("insert", "NEW"), ("delete", "OLD")):
+        cur.execute(f''' CREATE TRIGGER devices_change_{operation} AFTER {operation.upper()} ON devices
+                         WHEN (SELECT applying FROM sync_state) = 0
+                         BEGIN
+                             INSERT INTO change_log(table_name, operation, row_id, payload)
+                             VALUES ('devices', '{operation}', {row}.id,
+                                     json_object('name', {row}.name, 'power', {row}.power));
+                         END ''')
+        # a favourite's rows are inserted after it, sync.py reads them when the change is sent
+        cur.execute(f''' CREATE TRIGGER favourite_change_{operation} AFTER {operation.upper()} ON favourite
+                         WHEN (SELECT applying FROM sync_state) = 0
+                         BEGIN
+                             INSERT INTO change_log(table_name, operation, row_id, payload)
+                             VALUES ('favourite', '{operation}', {row}.id, json_object('name', {row}.name));
+                         END ''')
+
+    # what exists already is shared on the first sync
+    cur.execute(''' INSERT INTO change_log(table_name, operation, row_id, payload)
+                    SELECT 'devices', 'insert', id, json_object('name', name, 'power', power)
+                    FROM devices ORDER BY id ''')
+    cur.execute(''' INSERT INTO change_log(table_name, operation, row_id, payload)
+                    SELECT 'favourite', 'insert', id, json_object('name', name)
+                    FROM favourite ORDER BY id ''')
+
+
+# position in the list is the schema version reached after running the migration
+migrations = [
+    migration_create_tables,
+    migration_lookup_indexes,
+    migration_record_rows,
+    migration_daily_summary,
+    migration_tariffs,
+    migration_search_index,
+    migration_device_schedules,
+    migration_retention,
+    migration_change_log,
+]
+
+
+@timed()
+def migrate(conn):
+    cur = conn.cursor()
+    cur.execute("PRAGMA user_version")
+    version = cur.fetchone()[0]
+    if version >= len(migrations):
+        return
+
+    for target, migration in enumerate(migrations[version:], start=version + 1):
+        try:
+            cur.execute("BEGIN")
+            migration(conn)
+            cur.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Error as e:
+            conn.rollback()
+            print(e)
+            break
+
+
+@timed()
+def select_all_device(connection_to_db):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT * FROM devices")
+    rows = cur.fetchall()
+
+    return rows
+
+
+@timed()
+def select_all_favourite(connection_to_db):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT * FROM favourite")
+    rows = cur.fetchall()
+
+    return rows
+
+
+@timed()
+def select_all_history(connection_to_db):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT * FROM history")
+    rows = cur.fetchall()
+
+    return rows
+
+
+# statements are kept as constants so the connection's statement cache reuses the prepared versions
+sql_insert_device = ''' INSERT INTO devices(name,power)
+                        VALUES(?,?) '''
+
+sql_insert_favourite = ''' INSERT INTO favourite(name)
+                           VALUES(?)
+                           ON CONFLICT(name) DO NOTHING '''
+
+sql_insert_favourite_rows = ''' INSERT INTO favourite_rows(favourite_id,device_id,count,hours)
+                                VALUES(?,?,?,?) '''
+
+sql_insert_history = ''' INSERT INTO history(name,data_hash)
+                         VALUES(?,?)
+                         ON CONFLICT(data_hash) DO NOTHING '''
+
+sql_insert_history_rows = ''' INSERT INTO history_rows(history_id,device_id,count,hours)
+                              VALUES(?,?,?,?) '''
+
+sql_insert_history_search = ''' INSERT INTO history_search(rowid,title,devices)
+                                SELECT history.id, history.name,
+                                       (SELECT coalesce(group_concat(devices.name, ' '), '')
+                                        FROM history_rows JOIN devices ON devices.id = history_rows.device_id
+                                        WHERE history_rows.history_id = history.id)
+                                FROM history WHERE history.id = ? '''
+
+sql_insert_favourite_search = ''' INSERT INTO favourite_search(rowid,title,devices)
+                                  SELECT favourite.id, favourite.name,
+                                         (SELECT coalesce(group_concat(devices.name, ' '), '')
+                                          FROM favourite_rows JOIN devices ON devices.id = favourite_rows.device_id
+                                          WHERE favourite_rows.favourite_id = favourite.id)
+                                  FROM favourite WHERE favourite.id = ? '''
+
+
+def insert_favourite(cur, favourite):
+    name, rows = favourite
+    cur.execute(sql_insert_favourite, (name,))
+    if not cur.rowcount:
+        # a favourite with this name already exists
+        return None
+
+    favourite_id = cur.lastrowid
+    cur.executemany(sql_insert_favourite_rows, [(favourite_id, *row) for row in rows])
+    cur.execute(sql_insert_favourite_search, (favourite_id,))
+
+    return favourite_id
+
+
+def insert_history(cur, history):
+    name, rows = history
+    cur.execute(sql_insert_history, (name, record_hash(rows)))
+    if not cur.rowcount:
+        # the same record is already in history
+        return None
+
+    history_id = cur.lastrowid
+    cur.executemany(sql_insert_history_rows, [(history_id, *row) for row in rows])
+    cur.execute(sql_insert_history_search, (history_id,))
+
+    return history_id
+
+
+@timed()
+def create_device(connection_to_db, device):
+    cur = connection_to_db.cursor()
+    cur.execute(sql_insert_device, device)
+    connection_to_db.commit()
+
+    return cur.lastrowid
+
+
+@timed()
+def create_favourite(connection_to_db, favourite):
+    cur = connection_to_db.cursor()
+    try:
+        favourite_id = insert_favourite(cur, favourite)
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return favourite_id
+
+
+@timed()
+def create_history(connection_to_db, history):
+    cur = connection_to_db.cursor()
+    try:
+        history_id = insert_history(cur, history)
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return history_id
+
+
+@timed()
+def create_devices(connection_to_db, devices):
+    cur = connection_to_db.cursor()
+    try:
+        cur.executemany(sql_insert_device, devices)
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return cur.rowcount
+
+
+@timed()
+def create_favourites(connection_to_db, favourites):
+    cur = connection_to_db.cursor()
+    try:
+        favourite_ids = [insert_favourite(cur, favourite) for favourite in favourites]
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return favourite_ids
+
+
+@timed()
+def create_histories(connection_to_db, histories):
+    cur = connection_to_db.cursor()
+    try:
+        history_ids = [insert_history(cur, history) for history in histories]
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return history_ids
+
+
+@timed()
+def select_history_page(connection_to_db, before_id=None, limit=50):
+    cur = connection_to_db.cursor()
+    if before_id is None:
+        cur.execute("SELECT id, name FROM history ORDER BY id DESC LIMIT ?", (limit,))
+    else:
+        cur.execute("SELECT id, name FROM history WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit))
+    rows = cur.fetchall()
+
+    return rows
+
+
+@timed()
+def select_favourite_page(connection_to_db, before_id=None, limit=50):
+    cur = connection_to_db.cursor()
+    if before_id is None:
+        cur.execute("SELECT id, name FROM favourite ORDER BY id DESC LIMIT ?", (limit,))
+    else:
+        cur.execute("SELECT id, name FROM favourite WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit))
+    rows = cur.fetchall()
+
+    return rows
+
+
+@timed()
+def select_history(connection_to_db, history_id):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT * FROM history WHERE id=?", (history_id,))
+
+    return cur.fetchone()
+
+
+@timed()
+def select_favourite(connection_to_db, favourite_id):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT * FROM favourite WHERE id=?", (favourite_id,))
+
+    return cur.fetchone()
+
+
+@timed()
+def delete_history(connection_to_db, history_id):
+    cur = connection_to_db.cursor()
+    # the content hash tells callers which cached copies of the record to drop
+    cur.execute("DELETE FROM history WHERE id=? RETURNING data_hash", (history_id,))
+    row = cur.fetchone()
+    connection_to_db.commit()
+
+    return row[0] if row else None
+
+
+@timed()
+def delete_favourite(connection_to_db, favourite_id):
+    cur = connection_to_db.cursor()
+    cur.execute("DELETE FROM favourite WHERE id=?", (favourite_id,))
+    connection_to_db.commit()
+
+
+@timed()
+def delete_histories(connection_to_db, history_ids):
+    cur = connection_to_db.cursor()
+    try:
+        cur.execute("DELETE FROM history WHERE id IN (SELECT value FROM json_each(?)) RETURNING data_hash",
+                    (json.dumps(list(history_ids)),))
+        data_hashes = [row[0] for row in cur.fetchall()]
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return data_hashes
+
+
+@timed()
+def delete_favourites(connection_to_db, favourite_ids):
+    cur = connection_to_db.cursor()
+    try:
+        cur.execute("DELETE FROM favourite WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(list(favourite_ids)),))
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return cur.rowcount
+
+
+@timed()
+def select_history_rows(connection_to_db, history_id):
+    cur = connection_to_db.cursor()
+    cur.execute(''' SELECT devices.id, devices.name, devices.power, history_rows.count, history_rows.hours
+                    FROM history_rows JOIN devices ON devices.id = history_rows.device_id
+                    WHERE history_rows.history_id=?
+                    ORDER BY history_rows.id ''', (history_id,))
+    rows = cur.fetchall()
+
+    return rows
+
+
+@timed()
+def select_favourite_rows(connection_to_db, favourite_id):
+    cur = connection_to_db.cursor()
+    cur.execute(''' SELECT devices.id, devices.name, devices.power, favourite_rows.count, favourite_rows.hours
+                    FROM favourite_rows JOIN devices ON devices.id = favourite_rows.device_id
+                    WHERE favourite_rows.favourite_id=?
+                    ORDER BY favourite_rows.id ''', (favourite_id,))
+    rows = cur.fetchall()
+
+    return rows
+
+
+def search_query(text):
+    # each typed word becomes a phrase of its tokens, prefix-matched, so "2024-05" and "fri" work as typed
+    phrases = []
+    for word in text.split():
+        tokens = re.findall(r"\w+", word)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"*')
+
+    return " ".join(phrases)
+
+
+@timed()
+def search_history(connection_to_db, text, limit=50):
+    query = search_query(text)
+    if not query:
+        return []
+
+    cur = connection_to_db.cursor()
+    # names weigh more than device names in the bm25 rank
+    cur.execute(''' SELECT rowid, title FROM history_search
+                    WHERE history_search MATCH ?
+                    ORDER BY bm25(history_search, 5.0, 1.0)
+                    LIMIT ? ''', (query, limit))
+    rows = cur.fetchall()
+
+    return rows
+
+
+@timed()
+def search_favourite(connection_to_db, text, limit=50):
+    query = search_query(text)
+    if not query:
+        return []
+
+    cur = connection_to_db.cursor()
+    cur.execute(''' SELECT rowid, title FROM favourite_search
+                    WHERE favourite_search MATCH ?
+                    ORDER BY bm25(favourite_search, 5.0, 1.0)
+                    LIMIT ? ''', (query, limit))
+    rows = cur.fetchall()
+
+    return rows
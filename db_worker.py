@@ -0,0 +1,74 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from kivy.clock import Clock
+
+import instrumentation
+from profiles import ConnectionPool
+
+
+class DatabaseWorker(threading.Thread):
+    def __init__(self, db_file, max_connections=8):
+        super().__init__(daemon=True)
+        # requests go to the profile database that was current when they were submitted
+        self.db_file = db_file
+        self.pool = ConnectionPool(max_connections)
+        self.requests = queue.Queue()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+
+            future, func, args, db_file, submitted = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            if submitted is not None:
+                # time spent behind other requests, the helper itself is timed by its decorator
+                instrumentation.record("queue_wait", time.perf_counter() - submitted)
+            connection = self.pool.get(db_file)
+            if connection is None:
+                print("Error! cannot create the database connection.")
+            try:
+                future.set_result(func(connection, *args))
+            except Exception as e:
+                print(e)
+                # a failed helper may have left its transaction open, the next request on this connection would
+                # commit it
+                if connection is not None and connection.in_transaction:
+                    connection.rollback()
+                future.set_exception(e)
+
+        self.pool.close()
+
+    def submit(self, func, *args, callback=None, error_callback=None, db_file=None):
+        # db_file pins the request to a profile database, by default it goes to the current one
+        future = Future()
+        if callback is not None or error_callback is not None:
+            future.add_done_callback(lambda done: self.deliver(done, callback, error_callback))
+        submitted = time.perf_counter() if instrumentation.enabled else None
+        self.requests.put((future, func, args, db_file or self.db_file, submitted))
+
+        return future
+
+    @staticmethod
+    def deliver(future, callback, error_callback=None):
+        # callbacks always run on the Kivy main thread, callback for successful requests and error_callback,
+        # given the exception, for failed ones
+        if future.cancelled():
+            return
+        if future.exception() is None:
+            if callback is not None:
+                Clock.schedule_once(lambda dt: callback(future.result()))
+        elif error_callback is not None:
+            Clock.schedule_once(lambda dt: error_callback(future.exception()))
+
+    def switch(self, db_file):
+        self.db_file = db_file
+
+    def stop(self):
+        self.requests.put(None)
+        self.join()
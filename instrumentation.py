@@ -0,0 +1,99 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# set ENERGY_APP_PROFILE to a file path before starting the app to collect timings into it
+output_path = os.environ.get("ENERGY_APP_PROFILE")
+enabled = bool(output_path)
+
+# upper bounds of the latency histogram buckets, in milliseconds
+bucket_bounds = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf")]
+
+stats = {}
+stats_lock = threading.Lock()
+# name -> function returning a dict, added to the report as it is when the report is written
+stats_sources = {}
+
+
+def record(name, elapsed):
+    elapsed_ms = elapsed * 1000
+    with stats_lock:
+        operation = stats.get(name)
+        if operation is None:
+            operation = stats[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                       "histogram": [0] * len(bucket_bounds)}
+        operation["count"] += 1
+        operation["total_ms"] += elapsed_ms
+        operation["max_ms"] = max(operation["max_ms"], elapsed_ms)
+        operation["histogram"][bisect_left(bucket_bounds, elapsed_ms)] += 1
+
+
+def timed(name=None):
+    def decorator(func):
+        # when profiling is off the function is returned untouched, so there is no cost per call
+        if not enabled:
+            return func
+
+        operation = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(operation, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def time_until_drawn(name):
+    # on_draw follows layout, so this covers the layout and drawing work caused since the call
+    if not enabled:
+        return
+    from kivy.core.window import Window
+
+    start = time.perf_counter()
+
+    def drawn(*args):
+        Window.unbind(on_draw=drawn)
+        record(name, time.perf_counter() - start)
+
+    Window.bind(on_draw=drawn)
+
+
+def register_stats(name, source):
+    if enabled:
+        stats_sources[name] = source
+
+
+def report():
+    with stats_lock:
+        operations = {name: {"count": operation["count"],
+                             "total_ms": round(operation["total_ms"], 3),
+                             "mean_ms": round(operation["total_ms"] / operation["count"], 3),
+                             "max_ms": round(operation["max_ms"], 3),
+                             "histogram_ms": {f"<={bound:g}": count
+                                              for bound, count in zip(bucket_bounds, operation["histogram"])
+                                              if count}}
+                      for name, operation in sorted(stats.items())}
+
+    return {**{name: source() for name, source in stats_sources.items()}, **operations}
+
+
+def write_report(path=None):
+    path = path or output_path
+    if not path:
+        return
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report(), file, indent=2)
+
+
+if enabled:
+    atexit.register(write_report)
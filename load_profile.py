@@ -0,0 +1,133 @@
+import json
+
+import numpy as np
+
+from database import select_favourite_rows
+from instrumentation import timed
+
+minutes_per_day = 24 * 60
+
+
+def schedule_profiles(schedules, resolution=60):
+    # (schedules, 7, slots) share of each slot a schedule is on, for every weekday (bit 0 of weekdays is the
+    # first weekday). schedules are (start_minute, end_minute, weekdays, duty_cycle, cycle_minutes) with
+    # end_minute exclusive; a window that ends before it starts runs past midnight into the next weekday
+    if minutes_per_day % resolution:
+        raise ValueError(f"resolution must divide a day into whole slots: {resolution}")
+
+    schedules = np.asarray(schedules, dtype=np.float64).reshape(-1, 5)
+    start, end, weekdays, duty, cycle = (schedules[:, [i]] for i in range(5))
+    minute = np.arange(minutes_per_day, dtype=np.float64)
+
+    wraps = start > end
+    same_day = np.where(wraps, minute >= start, (minute >= start) & (minute < end))
+    next_day = wraps & (minute < end)
+
+    # cycling devices are fully on for the first duty share of every cycle, others draw their average all along
+    cycling = cycle > 0
+    phase = np.mod(minute - start, np.where(cycling, cycle, 1))
+    on = np.where(cycling, phase < duty * cycle, duty)
+
+    bits = (weekdays.astype(np.int64) >> np.arange(7)) & 1
+    # the part after midnight belongs to the day after the one the schedule is set for
+    profiles = bits[:, :, None] * (same_day * on)[:, None, :] + \
+        np.roll(bits, 1, axis=1)[:, :, None] * (next_day * on)[:, None, :]
+
+    return profiles.reshape(len(schedules), 7, -1, resolution).mean(axis=3)
+
+
+def row_profiles(rows, schedules, resolution=60, default_start_hour=0):
+    # rows are (device_id, name, power, count, hours) as select_favourite_rows returns them and schedules maps
+    # device ids to their schedules; unscheduled devices run the row's hours a day from default_start_hour
+    row_index = []
+    row_schedules = []
+    for index, (device_id, name, power, count, hours) in enumerate(rows):
+        device_schedules = schedules.get(device_id)
+        if not device_schedules:
+            start = default_start_hour * 60 % minutes_per_day
+            end = minutes_per_day if hours >= 24 else (start + hours * 60) % minutes_per_day
+            device_schedules = [(0 if hours >= 24 else start, end, 127, 1, 0)]
+        for schedule in device_schedules:
+            row_index.append(index)
+            row_schedules.append(schedule)
+
+    profiles = np.zeros((len(rows), 7, minutes_per_day // resolution))
+    if row_schedules:
+        # overlapping schedules of one device do not add up, the device is either on or off
+        np.maximum.at(profiles, np.asarray(row_index), schedule_profiles(row_schedules, resolution))
+
+    return profiles
+
+
+class LoadCurve:
+    def __init__(self, demand, days=365, resolution=60, first_weekday=0):
+        # demand is the (rows, 7, slots) kW each row draws on each weekday
+        self.resolution = resolution
+        self.weekday = (np.arange(days) + first_weekday) % 7
+        slots = demand.shape[2]
+
+        # only seven distinct days exist, the period is those days laid out in calendar order
+        self.curve = demand.sum(axis=0)[self.weekday].ravel()
+        self.peak_slot = int(self.curve.argmax()) if self.curve.size else 0
+        self.peak_kw = float(self.curve[self.peak_slot]) if self.curve.size else 0.0
+        self.energy_kwh = float(self.curve.sum()) * resolution / 60
+        self.load_factor = float(self.curve.mean()) / self.peak_kw if self.peak_kw else 0.0
+
+        # what every row draws at the moment of the overall peak, against the sum of the rows' own peaks
+        peak_day, peak_slot = divmod(self.peak_slot, slots)
+        self.coincident_kw = demand[:, self.weekday[peak_day], peak_slot] if self.curve.size else np.zeros(0)
+        row_peaks = demand[:, np.unique(self.weekday)].max(axis=(1, 2)) if demand.size else np.zeros(0)
+        self.coincidence_factor = self.peak_kw / float(row_peaks.sum()) if row_peaks.sum() else 0.0
+
+    def peak_time(self):
+        # (day of the period, minute of the day) of the peak
+        day, slot = divmod(self.peak_slot, minutes_per_day // self.resolution)
+        return day, slot * self.resolution
+
+
+def simulate(rows, schedules, days=365, resolution=60, first_weekday=0, default_start_hour=0):
+    profiles = row_profiles(rows, schedules, resolution, default_start_hour)
+    count = np.asarray([row[3] for row in rows], dtype=np.float64)
+    power = np.asarray([row[2] for row in rows], dtype=np.float64)
+    demand = (count * power / 1000)[:, None, None] * profiles
+
+    return LoadCurve(demand, days, resolution, first_weekday)
+
+
+def create_schedule(connection_to_db, schedule):
+    # schedule is (device_id, start_minute, end_minute, weekdays, duty_cycle, cycle_minutes)
+    cur = connection_to_db.cursor()
+    cur.execute(''' INSERT INTO device_schedules(device_id,start_minute,end_minute,weekdays,duty_cycle,cycle_minutes)
+                    VALUES(?,?,?,?,?,?) ''', schedule)
+    connection_to_db.commit()
+
+    return cur.lastrowid
+
+
+def select_device_schedules(connection_to_db, device_ids):
+    cur = connection_to_db.cursor()
+    cur.execute(''' SELECT device_id, start_minute, end_minute, weekdays, duty_cycle, cycle_minutes
+                    FROM device_schedules
+                    WHERE device_id IN (SELECT value FROM json_each(?))
+                    ORDER BY id ''', (json.dumps(list(device_ids)),))
+
+    schedules = {}
+    for device_id, *schedule in cur.fetchall():
+        schedules.setdefault(device_id, []).append(tuple(schedule))
+
+    return schedules
+
+
+def delete_device_schedules(connection_to_db, device_id):
+    cur = connection_to_db.cursor()
+    cur.execute("DELETE FROM device_schedules WHERE device_id=?", (device_id,))
+    connection_to_db.commit()
+
+
+@timed()
+def simulate_favourite(connection_to_db, favourite_id, days=365, resolution=60, first_weekday=0,
+                       default_start_hour=0):
+    rows = select_favourite_rows(connection_to_db, favourite_id)
+    schedules = select_device_schedules(connection_to_db, {row[0] for row in rows})
+
+    return simulate(rows, schedules, days, resolution, first_weekday, default_start_hour)
@@ -1,147 +1,79 @@
 # Kivy imports
 from kivy.uix.screenmanager import Screen, ScreenManager, NoTransition
 from kivy.uix.floatlayout import FloatLayout
-from kivy.uix.gridlayout import GridLayout
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.spinner import Spinner, SpinnerOption
+from kivy.uix.spinner import Spinner
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
 from kivy.uix.boxlayout import BoxLayout
 from kivy.core.window import Window
+from kivy.clock import Clock
 from kivy.app import App
 
 # time
+import os
+import threading
+import time
 from datetime import datetime
+from functools import partial
 
 # SQLite
-import sqlite3
-from sqlite3 import Error
-
-button_size = Window.size[1]/20
+from database import (select_all_device, create_device, create_favourite,
+                      create_history, select_history_page, select_favourite_page, select_favourite,
+                      delete_history, delete_favourite,
+                      delete_histories, delete_favourites, search_history, search_favourite)
+from db_worker import DatabaseWorker
+from catalog import DeviceCatalog, device_label
+from record_cache import RecordCache, select_record
+from profiles import (default_profile, profile_path, list_profiles, create_profile, valid_profile_name,
+                      total_by_profile)
+import instrumentation
+from instrumentation import timed, time_until_drawn
+from widgets import button_size, MyTextInput
+
+# seconds of typing pause before a row's kWh is recalculated
+recalculate_delay = 0.3
+# seconds of typing pause before a search runs
+search_delay = 0.2
+# seconds between runs of the history retention job, and entries it removes per database request
+retention_interval = 3600
+retention_chunk = 500
+# seconds of each frame spent adding the rows of an opened record, the rest go in later frames
+load_frame_budget = 0.008
+# devices and favourites are shared through this sync server when set, see sync.py
+sync_url = os.environ.get("ENERGY_APP_SYNC_URL")
+sync_interval = 300
+sync_thread = None
 Window.softinput_mode = "below_target"
 
 
-def create_connection(db_file):
-    conn = None
-    try:
-        conn = sqlite3.connect(db_file)
-        return conn
-    except Error as e:
-        print(e)
-
-    return conn
-
-
-def create_table(conn, create_table_sql):
-    try:
-        c = conn.cursor()
-        c.execute(create_table_sql)
-    except Error as e:
-        print(e)
-
-
-connection = create_connection(r"database.db")
-
-sql_create_devices_table = """ CREATE TABLE IF NOT EXISTS devices (
-                                    id integer PRIMARY KEY,
-                                    name text NOT NULL,
-                                    power integer
-                                ); """
-
-sql_create_history_table = """CREATE TABLE IF NOT EXISTS history (
-                                id integer PRIMARY KEY,
-                                name datetime,
-                                data text
-                            );"""
-
-
-sql_create_favourite_table = """CREATE TABLE IF NOT EXISTS favourite (
-                                id integer PRIMARY KEY,
-                                name text,
-                                data text
-                            );"""
-
-if connection is not None:
-    create_table(connection, sql_create_devices_table)
-    create_table(connection, sql_create_history_table)
-    create_table(connection, sql_create_favourite_table)
-else:
-    print("Error! cannot create the database connection.")
-
-
-def select_all_device():
-    cur = connection.cursor()
-    cur.execute("SELECT * FROM devices")
-    rows = cur.fetchall()
-
-    return rows
-
-
-def select_all_favourite():
-    cur = connection.cursor()
-    cur.execute("SELECT * FROM favourite")
-    rows = cur.fetchall()
-
-    return rows
-
-
-def select_all_history():
-    cur = connection.cursor()
-    cur.execute("SELECT * FROM history")
-    rows = cur.fetchall()
-
-    return rows
-
-
-def create_device(connection_to_db, device):
-    sql = ''' INSERT INTO devices(name,power)
-              VALUES(?,?) '''
-    cur = connection_to_db.cursor()
-    cur.execute(sql, device)
-    connection_to_db.commit()
+# started in MyApp.build, requests submitted before that wait in its queue
+db_worker = DatabaseWorker(profile_path(default_profile))
+# rows and kWh of recently opened records, so opening one again needs no query or calculation
+record_cache = RecordCache()
+instrumentation.register_stats("record_cache", record_cache.stats)
 
-    return cur.lastrowid
 
+def for_current_profile(callback):
+    # wraps a request's callback so its result is dropped if the profile changes before it arrives
+    db_file = db_worker.db_file
 
-def create_favourite(connection_to_db, favourite):
-    sql = ''' INSERT INTO favourite(name,data)
-              VALUES(?,?) '''
-    cur = connection_to_db.cursor()
-    cur.execute(sql, favourite)
-    connection_to_db.commit()
+    def deliver(result):
+        if db_worker.db_file == db_file:
+            callback(result)
 
-    return cur.lastrowid
+    return deliver
 
 
-def create_history(connection_to_db, history):
-    sql = ''' INSERT INTO history(name,data)
-              VALUES(?,?) '''
-    cur = connection_to_db.cursor()
-    cur.execute(sql, history)
-    connection_to_db.commit()
-
-    return cur.lastrowid
-
-
-class SpinnerOptions(SpinnerOption):
-    def __init__(self, **kwargs):
-        super(SpinnerOptions, self).__init__(**kwargs)
-        self.height = button_size
-
-
-class SpinnerWidget(Spinner):
-    def __init__(self, **kwargs):
-        super(SpinnerWidget, self).__init__(**kwargs)
-        self.option_cls = SpinnerOptions
-
-
-class MyTextInput(TextInput):
-    def on_touch_down(self, touch):
-        if self.collide_point(*touch.pos) and self.text != "":
-            self.text = ""
-        return super(MyTextInput, self).on_touch_down(touch)
+def show_warning(title):
+    btn_close = BoxLayout(orientation="horizontal")
+    popup_warning = Popup(title=title,
+                          content=btn_close,
+                          size_hint=(None, None),
+                          size=(Window.width / 2, Window.height / 8))
+    btn_close.add_widget(Button(text="close", on_press=popup_warning.dismiss))
+    popup_warning.open()
 
 
 class HomeScreen(Screen):
@@ -149,45 +81,107 @@ class HomeScreen(Screen):
         super().__init__(**kwargs)
         self.float_layout = FloatLayout()
 
+        self.spinner_profile = Spinner(text=default_profile,
+                                       values=list_profiles(),
+                                       pos_hint={"x": 0.2, "y": 0.87},
+                                       size_hint=(0.4, 0.08))
+        self.spinner_profile.bind(text=self.select_profile)
+        self.float_layout.add_widget(self.spinner_profile)
+
+        popup_content = BoxLayout(orientation="vertical")
+        popup_content.add_widget(Label(text='Profile name'))
+        self.text_profile = MyTextInput(text='')
+        popup_content.add_widget(self.text_profile)
+        popup_content.add_widget(Button(text="Submit", on_press=self.add_new_profile))
+
+        self.popup_new_profile = Popup(title='Add new profile',
+                                       content=popup_content,
+                                       size_hint=(None, None),
+                                       size=(Window.width/1.5, Window.height/4))
+
+        self.btn_new_profile = Button(text="New profile",
+                                      pos_hint={"x": 0.6, "y": 0.87},
+                                      size_hint=(0.2, 0.08),
+                                      on_press=self.popup_new_profile.open)
+        self.float_layout.add_widget(self.btn_new_profile)
+
         self.btn_new_calculation = Button(text="New Calculation",
-                                          pos_hint={"x": 0.2, "y": 0.5},
+                                          pos_hint={"x": 0.2, "y": 0.7},
                                           size_hint=(0.6, 0.1),
                                           on_press=self.go_to)
         self.float_layout.add_widget(self.btn_new_calculation)
 
         self.btn_history = Button(text="History",
-                                  pos_hint={"x": 0.2, "y": 0.3},
+                                  pos_hint={"x": 0.2, "y": 0.5},
                                   size_hint=(0.6, 0.1),
                                   on_press=self.go_to)
         self.float_layout.add_widget(self.btn_history)
 
         self.btn_favourite = Button(text="Favourite",
-                                    pos_hint={"x": 0.2, "y": 0.1},
+                                    pos_hint={"x": 0.2, "y": 0.3},
                                     size_hint=(0.6, 0.1),
                                     on_press=self.go_to)
         self.float_layout.add_widget(self.btn_favourite)
 
+        self.btn_report = Button(text="Report",
+                                 pos_hint={"x": 0.2, "y": 0.1},
+                                 size_hint=(0.6, 0.1),
+                                 on_press=self.go_to)
+        self.float_layout.add_widget(self.btn_report)
+
         self.add_widget(self.float_layout)
 
+    def select_profile(self, instance, name):
+        switch_profile(name)
+
+    def add_new_profile(self, instance):
+        name = self.text_profile.text.strip()
+        if valid_profile_name(name):
+            create_profile(name)
+            if name not in self.spinner_profile.values:
+                self.spinner_profile.values = self.spinner_profile.values + [name]
+            self.spinner_profile.text = name
+            self.popup_new_profile.dismiss()
+        self.text_profile.text = ""
+
     def go_to(self, instance):
         if instance == self.btn_new_calculation:
+            get_screen("calculation")
             screen_manager.current = "calculation"
         elif instance == self.btn_history:
-            s1 = screen_manager.get_screen("history")
+            s1 = get_screen("history")
             s1.load_history()
             screen_manager.current = "history"
         elif instance == self.btn_favourite:
-            s1 = screen_manager.get_screen("favourite")
+            s1 = get_screen("favourite")
             s1.load_favourite()
             screen_manager.current = "favourite"
+        elif instance == self.btn_report:
+            s1 = get_screen("report")
+            s1.load_report(s1.btn_month)
+            screen_manager.current = "report"
 
 
 class CalculationScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        from calculation_list import CalculationList
+
         self.float_layout = FloatLayout()
-        self.body_row_data = []
-        self.devices = [f"{device[1]} {device[2]} W" for device in select_all_device()]
+        # kWh currently counted for each row on the list, keyed by the row's key, and their sum
+        self.row_value = {}
+        self.total_value = 0
+        self.next_key = 0
+        # rows typed into since the last recalculation, by key
+        self.edited_rows = {}
+        self.recalculate_trigger = Clock.create_trigger(self.recalculate_rows, recalculate_delay)
+        # rows of the opened record and their kWh, added from next_row on by the loading Clock event
+        self.pending_rows = []
+        self.pending_values = []
+        self.next_row = 0
+        self.loading = None
+        self.catalog = DeviceCatalog()
+        db_worker.submit(select_all_device, callback=for_current_profile(self.catalog.load))
 
         popup_content = BoxLayout(orientation="vertical")
 
@@ -210,10 +204,16 @@ class CalculationScreen(Screen):
 
         btn = Button(text="Add new device",
                      pos_hint={"x": 0, "y": 1 - button_size/Window.size[1]},
-                     size_hint=(0.6, button_size/Window.size[1]),
+                     size_hint=(0.3, button_size/Window.size[1]),
                      on_press=self.popup_new_device.open)
         self.float_layout.add_widget(btn)
 
+        self.device_filter = TextInput(hint_text="Filter devices",
+                                       multiline=False,
+                                       pos_hint={"x": 0.3, "y": 1 - button_size/Window.size[1]},
+                                       size_hint=(0.3, button_size/Window.size[1]))
+        self.float_layout.add_widget(self.device_filter)
+
         btn_new_line = Button(text="Add row",
                               pos_hint={"x": 0.6, "y": 1 - button_size/Window.size[1]},
                               size_hint=(0.2, button_size/Window.size[1]),
@@ -226,19 +226,12 @@ class CalculationScreen(Screen):
                                       on_press=self.change_view)
         self.float_layout.add_widget(self.btn_change_home)
 
-        self.layout = GridLayout(cols=5, spacing=10, size_hint_y=None)
-        self.layout.bind(minimum_height=self.layout.setter('height'))
-
-        # root = ScrollView(size_hint=(1, None),
-        #                   size=(Window.width, 8.5*Window.height/10-20),
-        #                   pos_hint={"x": 0, "y": 0.1 + 10/Window.height})
-
-        root = ScrollView(size_hint=(1, None),
-                          size=(Window.width, Window.height - 3 * button_size - 20),
-                          pos_hint={"x": 0, "y": (2 * button_size + 10)/Window.size[1]})
-
-        root.add_widget(self.layout)
-        self.float_layout.add_widget(root)
+        # only the rows in view have widgets, scrolling hands them the rows coming into view
+        self.rows = CalculationList(self.catalog, self.device_filter, self.row_edited, self.row_removed,
+                                    size_hint=(1, None),
+                                    size=(Window.width, Window.height - 3 * button_size - 20),
+                                    pos_hint={"x": 0, "y": (2 * button_size + 10)/Window.size[1]})
+        self.float_layout.add_widget(self.rows)
 
         self.favourite_name = MyTextInput(text="<Favourite>",
                                           halign="center",
@@ -266,150 +259,180 @@ class CalculationScreen(Screen):
 
         self.add_new_row()
 
+    def new_row(self, count, hours, device, result="- kWh", value=0):
+        # rows are plain dicts on the list's data, the key tells them apart once they are moved or removed
+        row = {"key": self.next_key, "count": count, "hours": hours, "device": device, "result": result}
+        self.next_key += 1
+        self.row_value[row["key"]] = value
+        return row
+
+    def row_removed(self, row):
+        self.set_row_value(row, 0)
+        del self.row_value[row["key"]]
+        self.edited_rows.pop(row["key"], None)
+
+    def clear_rows(self):
+        self.rows.data = []
+        self.row_value = {}
+        self.edited_rows = {}
+        self.total_value = 0
+
+    def set_row_value(self, row, value):
+        # only the difference to the row's previous value touches the total
+        self.total_value += value - self.row_value[row["key"]]
+        self.row_value[row["key"]] = value
+        self.label_result.text = str(round(self.total_value, 2)) + " kWh"
+
+    def row_edited(self, row):
+        self.edited_rows[row["key"]] = row
+        self.recalculate_trigger()
+
+    @timed()
+    def recalculate_rows(self, dt=None):
+        # NumPy is only loaded once the first calculation happens
+        from calculation import row_consumption
+
+        rows, self.edited_rows = self.edited_rows, {}
+        for row in rows.values():
+            try:
+                value = row_consumption(int(row["count"]), int(row["hours"]), self.catalog.get(row["device"])[2])
+                row["result"] = str(value) + " kWh"
+            except (ValueError, KeyError):
+                value = 0
+                row["result"] = "- kWh"
+            self.set_row_value(row, value)
+        self.rows.refresh_from_data()
+
     def add_new_row(self, instance=None):
-        spin_number = MyTextInput(text="num",
-                                  halign="center",
-                                  size_hint_x=None,
-                                  width=Window.size[0]/8)
-        self.layout.add_widget(spin_number)
-
-        spin_time = MyTextInput(text="time",
-                                halign="center",
-                                size_hint_x=None,
-                                width=Window.size[0]/8)
-        self.layout.add_widget(spin_time)
-
-        spin = SpinnerWidget(text="device",
-                             values=self.devices,
-                             size_hint_y=None,
-                             height=Window.height/20,
-                             size_hint_x=None,
-                             width=Window.size[0]/3)
-        self.layout.add_widget(spin)
-
-        btn_x = Button(text="x",
-                       size_hint_y=None,
-                       height=Window.height/20,
-                       size_hint_x=None,
-                       width=Window.size[0]/6,
-                       on_press=self.remove_row)
-        self.layout.add_widget(btn_x)
-
-        label_result = Label(text="- kWh",
-                             size_hint_x=None,
-                             width=Window.size[0]/6)
-        self.layout.add_widget(label_result)
-
-        self.body_row_data.append([spin_number, spin_time, spin, label_result, btn_x])
-
-    def remove_row(self, instance):
-        for row in self.body_row_data:
-            if instance in row:
-                for widget in row:
-                    self.layout.remove_widget(widget)
-                self.body_row_data.remove(row)
-
-    def update_from_history(self, data):
-        for row in self.body_row_data.copy():
-            for widget in row:
-                self.layout.remove_widget(widget)
-            self.body_row_data.remove(row)
-        data = data[2].split("|")
-        data.remove('')
-        index = int(data[0])
-        data.pop(0)
-        for i in range(index):
-            spin_number = MyTextInput(text=str(data[0 + 3 * i]),
-                                      halign="center",
-                                      size_hint_x=None,
-                                      width=Window.size[0] / 8)
-            self.layout.add_widget(spin_number)
-
-            spin_time = MyTextInput(text=str(data[1 + 3 * i]),
-                                    halign="center",
-                                    size_hint_x=None,
-                                    width=Window.size[0] / 8)
-            self.layout.add_widget(spin_time)
-
-            spin = SpinnerWidget(text=str(data[2 + 3 * i]),
-                                 values=self.devices,
-                                 size_hint_y=None,
-                                 height=Window.height / 20,
-                                 size_hint_x=None,
-                                 width=Window.size[0] / 3)
-            self.layout.add_widget(spin)
-
-            btn_x = Button(text="x",
-                           size_hint_y=None,
-                           height=Window.height / 20,
-                           size_hint_x=None,
-                           width=Window.size[0] / 6,
-                           on_press=self.remove_row)
-            self.layout.add_widget(btn_x)
-
-            label_result = Label(text="- kWh",
-                                 size_hint_x=None,
-                                 width=Window.size[0] / 6)
-            self.layout.add_widget(label_result)
-
-            self.body_row_data.append([spin_number, spin_time, spin, label_result, btn_x])
+        # a row added while a record loads would land among its rows
+        self.finish_loading()
+        self.rows.data.append(self.new_row("num", "time", "device"))
+
+    def show_record(self, record):
+        # the total is shown right away, the rows follow a frame budget's worth at a time
+        name, rows, row_values, total = record
+        self.cancel_loading()
+        self.clear_rows()
+
+        self.total_value = total
+        self.label_result.text = str(round(self.total_value, 2)) + " kWh"
+        self.pending_rows = rows
+        self.pending_values = row_values
+        self.next_row = 0
+        self.loading_started = time.perf_counter()
+        self.loading = Clock.schedule_interval(self.load_rows, 0)
+        self.load_rows()
+
+    @timed()
+    def load_rows(self, dt=None):
+        if self.loading is None:
+            return False
+        # the list only makes widgets for the rows in view, so a chunk is as many rows as fit in the budget. A new
+        # row widget takes about the whole budget, so until the view is full rows only come as fast as there are
+        # widgets left from an earlier record, or one a frame
+        deadline = time.perf_counter() + load_frame_budget
+        last_row = len(self.pending_rows)
+        shown = len(self.rows.data)
+        if shown < self.rows.rows_in_view():
+            last_row = min(last_row, self.next_row + max(self.rows.view_count() - shown, 1))
+        chunk = []
+        while self.next_row < last_row and (not chunk or time.perf_counter() < deadline):
+            chunk.append(self.pending_row(self.next_row))
+            self.next_row += 1
+        if chunk:
+            self.rows.data.extend(chunk)
+
+        if self.next_row == len(self.pending_rows):
+            self.loading.cancel()
+            self.loading = None
+            if instrumentation.enabled:
+                instrumentation.record("CalculationScreen.show_record.loaded",
+                                       time.perf_counter() - self.loading_started)
+            return False
+
+    def pending_row(self, index):
+        device_id, name, power, count, hours = self.pending_rows[index]
+        value = self.pending_values[index]
+        # already part of the total shown
+        return self.new_row(str(count), str(hours), device_label(name, power), str(value) + " kWh", value)
+
+    def finish_loading(self):
+        # the rows left are only dicts, so they can all be added at once when the whole record is needed now
+        if self.loading is None:
+            return
+        self.rows.data.extend([self.pending_row(index) for index in range(self.next_row, len(self.pending_rows))])
+        self.next_row = len(self.pending_rows)
+        self.load_rows()
+
+    def cancel_loading(self):
+        if self.loading is None:
+            return
+        self.loading.cancel()
+        self.loading = None
+        # rows never added leave the total
+        self.total_value -= sum(self.pending_values[self.next_row:])
+        self.label_result.text = str(round(self.total_value, 2)) + " kWh"
+
+    def on_leave(self, *args):
+        self.cancel_loading()
+
+    def reload_devices(self):
+        # rows on screen refer to the previous profile's devices
+        self.cancel_loading()
+        self.clear_rows()
+        self.label_result.text = "- kWh"
+        self.add_new_row()
+        self.catalog.clear()
+        db_worker.submit(select_all_device, callback=for_current_profile(self.catalog.load))
 
     def add_new_device(self, instance):
         device_name = self.text_box_1.text
         device_power = self.text_box_2.text
         if device_name and device_power:
-            self.devices.append(f"{str(device_name)} {str(device_power)} W")
-            for element in self.body_row_data:
-                element[2].values = self.devices
+            device = (device_name, int(device_power))
+            db_worker.submit(create_device, device,
+                             callback=for_current_profile(lambda device_id: self.catalog.add((device_id, *device))))
             self.popup_new_device.dismiss()
-            create_device(connection, (device_name, int(device_power)))
         self.text_box_1.text = ""
         self.text_box_2.text = ""
 
+    @timed()
     def save(self, instance):
-        value = 0
+        from calculation import compute_consumption
+
+        # saving a partly loaded record would save only its first rows
+        self.finish_loading()
         try:
-            record = f"{len(self.body_row_data)}|"
-            for row in self.body_row_data:
-                temp_value = int(row[0].text) * int(row[1].text) * int(row[2].text.split(" ")[1]) / 1000
-                row[3].text = str(temp_value) + " kWh"
-                value += temp_value
-                record += f"{row[0].text}|{row[1].text}|{row[2].text}|"
+            rows = self.rows.data
+            count = [int(row["count"]) for row in rows]
+            hours = [int(row["hours"]) for row in rows]
+            devices = [self.catalog.get(row["device"]) for row in rows]
 
-            cur = connection.cursor()
-            cur.execute("SELECT * FROM favourite WHERE name=?", (self.favourite_name.text,))
-            data1 = cur.fetchall()
+            rows_value, value = compute_consumption(count, hours, [device[2] for device in devices])
 
-            cur.execute("SELECT * FROM history WHERE data=?", (record,))
-            data2 = cur.fetchall()
+            for row, temp_value in zip(rows, rows_value.tolist()):
+                row["result"] = str(temp_value) + " kWh"
+                self.row_value[row["key"]] = temp_value
+            self.total_value = value
+            self.rows.refresh_from_data()
+            record = [(device[0], c, h) for device, c, h in zip(devices, count, hours)]
 
             if instance == self.btn_save:
-                if not data1:
-                    create_favourite(connection, (self.favourite_name.text, record))
-                else:
-                    btn_close = BoxLayout(orientation="horizontal")
-                    popup_warning = Popup(title='Favourite already exist!',
-                                          content=btn_close,
-                                          size_hint=(None, None),
-                                          size=(Window.width / 2, Window.height / 8))
-                    btn_close.add_widget(Button(text="close", on_press=popup_warning.dismiss))
-                    popup_warning.open()
-
-                if not data2:
-                    create_history(connection, (datetime.today(), record))
-            elif instance == self.btn_print:
-                if not data2:
-                    create_history(connection, (datetime.today(), record))
-        except (ValueError, IndexError):
-            btn_close = BoxLayout(orientation="horizontal")
-            popup_warning = Popup(title='Incorrect input',
-                                  content=btn_close,
-                                  size_hint=(None, None),
-                                  size=(Window.width / 2, Window.height / 8))
-            btn_close.add_widget(Button(text="close", on_press=popup_warning.dismiss))
-            popup_warning.open()
-
-        self.label_result.text = str(round(value, 2)) + " kWh"
+                db_worker.submit(create_favourite, (self.favourite_name.text, record),
+                                 callback=self.favourite_saved, error_callback=self.save_failed)
+
+            db_worker.submit(create_history, (datetime.today(), record), error_callback=self.save_failed)
+        except (ValueError, IndexError, KeyError):
+            show_warning('Incorrect input')
+
+        self.label_result.text = str(round(self.total_value, 2)) + " kWh"
+
+    def favourite_saved(self, favourite_id):
+        if favourite_id is None:
+            show_warning('Favourite already exist!')
+
+    def save_failed(self, error):
+        show_warning('Could not save')
 
     def change_view(self, instance):
         if instance == self.btn_change_home:
@@ -418,9 +441,10 @@ class CalculationScreen(Screen):
 
 class HistoryScreen(Screen):
     def __init__(self, **kwargs):
+        from record_list import RecordList
+
         super().__init__(**kwargs)
         self.float_layout = FloatLayout()
-        self.button_list = []
 
         self.btn_change_view_home = Button(text="Menu",
                                            pos_hint={"x": 0, "y": 0.95},
@@ -428,68 +452,75 @@ class HistoryScreen(Screen):
                                            on_press=self.change_view)
         self.float_layout.add_widget(self.btn_change_view_home)
 
-        self.layout = GridLayout(cols=2, spacing=10, size_hint_y=None)
-        self.layout.bind(minimum_height=self.layout.setter('height'))
-
-        root = ScrollView(size_hint=(1, None),
-                          size=(Window.width, 0.95 * Window.height-10),
-                          pos_hint={"x": 0, "y": 0})
-        root.add_widget(self.layout)
-        self.float_layout.add_widget(root)
+        self.search_input = TextInput(hint_text="Search",
+                                      multiline=False,
+                                      pos_hint={"x": 0, "y": 0.9},
+                                      size_hint=(0.7, 0.05))
+        self.float_layout.add_widget(self.search_input)
+        search_trigger = Clock.create_trigger(self.search, search_delay)
+        self.search_input.bind(text=lambda instance, value: search_trigger())
+
+        self.record_list = RecordList(load_page=self.load_page,
+                                      open_record=self.update,
+                                      remove_record=self.remove_history,
+                                      remove_records=self.remove_histories,
+                                      search_records=self.search_records,
+                                      size_hint=(1, None),
+                                      size=(Window.width, 0.9 * Window.height-10),
+                                      pos_hint={"x": 0, "y": 0})
+        self.float_layout.add_widget(self.record_list)
+
+        self.btn_remove_selected = Button(text="Delete selected",
+                                          pos_hint={"x": 0.7, "y": 0.9},
+                                          size_hint=(0.3, 0.05),
+                                          on_press=self.record_list.remove_selected)
+        self.float_layout.add_widget(self.btn_remove_selected)
         self.add_widget(self.float_layout)
 
+    @timed()
     def load_history(self, instance=None):
-        for row in self.button_list.copy():
-            for widget in row:
-                self.layout.remove_widget(widget)
-            self.button_list.remove(row)
-
-        data_buttons = select_all_history()
-
-        for record in data_buttons[::-1]:
-
-            btn_change_view = Button(text=str(record[1]),
-                                     size_hint_y=None,
-                                     height=Window.height / 20,
-                                     size_hint_x=None,
-                                     width=Window.width - 50,
-                                     on_press=self.update)
-            self.layout.add_widget(btn_change_view)
-
-            btn_change_x = Button(text="X",
-                                  size_hint_y=None,
-                                  height=Window.height / 20,
-                                  size_hint_x=None,
-                                  width=40,
-                                  on_press=self.remove_history)
-
-            self.layout.add_widget(btn_change_x)
-
-            self.button_list.append([btn_change_view, btn_change_x])
-
-    def remove_history(self, instance):
-        for record in self.button_list:
-            if instance == record[1]:
-
-                cur = connection.cursor()
-                cur.execute("SELECT * FROM history WHERE name=?", (record[0].text,))
-                rows = cur.fetchall()
-                if rows:
-                    history_record = rows[0][0]
-                    cur.execute('DELETE FROM history WHERE id=?', (history_record,))
-                    connection.commit()
-                self.layout.remove_widget(record[0])
-                self.layout.remove_widget(record[1])
-                self.button_list.remove(record)
-
-    def update(self, instance):
-        cur = connection.cursor()
-        cur.execute("SELECT * FROM history WHERE name=?", (instance.text,))
-        data = cur.fetchall()[0]
-        s1 = screen_manager.get_screen('calculation')
-        s1.update_from_history(data)
-        s1.save(s1.btn_print)
+        # an empty search box shows the full list
+        self.search()
+
+    def load_page(self, before_id, limit, callback, error_callback):
+        db_worker.submit(select_history_page, before_id, limit, callback=callback, error_callback=error_callback)
+
+    def search(self, dt=None):
+        self.record_list.search(self.search_input.text)
+
+    def search_records(self, text, limit, callback, error_callback):
+        db_worker.submit(search_history, text, limit, callback=callback, error_callback=error_callback)
+
+    def remove_history(self, history_id):
+        # favourites with the same rows share the cached entry, it goes by content hash
+        db_worker.submit(delete_history, history_id, callback=record_cache.discard)
+
+    def remove_histories(self, history_ids):
+        db_worker.submit(delete_histories, history_ids, callback=self.histories_removed)
+
+    def histories_removed(self, data_hashes):
+        for data_hash in data_hashes:
+            record_cache.discard(data_hash)
+
+    def update(self, history_id):
+        record = record_cache.get("history", history_id)
+        if record is not None:
+            self.open_history(record)
+        else:
+            # rows are read and their kWh calculated on the database worker
+            db_worker.submit(select_record, "history", history_id,
+                             callback=for_current_profile(partial(self.load_history_rows, history_id)))
+
+    def load_history_rows(self, history_id, parsed):
+        self.open_history(record_cache.put("history", history_id, None, parsed))
+
+    @timed()
+    def open_history(self, record):
+        # the record is in history already, there is nothing to save
+        s1 = get_screen('calculation')
+        s1.show_record(record)
         screen_manager.current = "calculation"
+        time_until_drawn("HistoryScreen.open_history.drawn")
 
     def change_view(self, instance=None):
         if instance == self.btn_change_view_home:
@@ -498,8 +529,9 @@ class HistoryScreen(Screen):
 
 class FavouriteScreen(Screen):
     def __init__(self, **kwargs):
+        from record_list import RecordList
+
         super().__init__(**kwargs)
-        self.button_list = []
         self.float_layout = FloatLayout()
 
         self.btn_change_view_home = Button(text="Menu",
@@ -508,70 +540,173 @@ class FavouriteScreen(Screen):
                                            on_press=self.change_view)
         self.float_layout.add_widget(self.btn_change_view_home)
 
-        self.layout = GridLayout(cols=2, spacing=10, size_hint_y=None)
-        self.layout.bind(minimum_height=self.layout.setter('height'))
-
-        root = ScrollView(size_hint=(1, None),
-                          size=(Window.width, 0.95 * Window.height-10),
-                          pos_hint={"x": 0, "y": 0})
-        root.add_widget(self.layout)
-        self.float_layout.add_widget(root)
+        self.search_input = TextInput(hint_text="Search",
+                                      multiline=False,
+                                      pos_hint={"x": 0, "y": 0.9},
+                                      size_hint=(0.7, 0.05))
+        self.float_layout.add_widget(self.search_input)
+        search_trigger = Clock.create_trigger(self.search, search_delay)
+        self.search_input.bind(text=lambda instance, value: search_trigger())
+
+        self.record_list = RecordList(load_page=self.load_page,
+                                      open_record=self.update,
+                                      remove_record=self.remove_favourite,
+                                      remove_records=self.remove_favourites,
+                                      search_records=self.search_records,
+                                      size_hint=(1, None),
+                                      size=(Window.width, 0.9 * Window.height-10),
+                                      pos_hint={"x": 0, "y": 0})
+        self.float_layout.add_widget(self.record_list)
+
+        self.btn_remove_selected = Button(text="Delete selected",
+                                          pos_hint={"x": 0.7, "y": 0.9},
+                                          size_hint=(0.3, 0.05),
+                                          on_press=self.record_list.remove_selected)
+        self.float_layout.add_widget(self.btn_remove_selected)
         self.add_widget(self.float_layout)
 
+    @timed()
     def load_favourite(self, instance=None):
-        for row in self.button_list.copy():
-            for widget in row:
-                self.layout.remove_widget(widget)
-            self.button_list.remove(row)
-
-        data_buttons = select_all_favourite()
-
-        for record in data_buttons[::-1]:
-            btn_change_view = Button(text=str(record[1]),
-                                     size_hint_y=None,
-                                     height=Window.height / 20,
-                                     size_hint_x=None,
-                                     width=Window.width - 50,
-                                     on_press=self.update)
-            self.layout.add_widget(btn_change_view)
-
-            btn_change_x = Button(text="X",
-                                  size_hint_y=None,
-                                  height=Window.height / 20,
-                                  size_hint_x=None,
-                                  width=40,
-                                  on_press=self.remove_favourite)
-
-            self.layout.add_widget(btn_change_x)
-
-            self.button_list.append([btn_change_view, btn_change_x])
-
-    def update(self, instance):
-
-        cur = connection.cursor()
-        cur.execute("SELECT * FROM favourite WHERE name=?", (instance.text,))
-        data = cur.fetchall()[0]
-
-        s1 = screen_manager.get_screen("calculation")
-        s1.update_from_history(data)
-        s1.save(s1.btn_print)
-        s1.favourite_name.text = instance.text
+        # an empty search box shows the full list
+        self.search()
+
+    def load_page(self, before_id, limit, callback, error_callback):
+        db_worker.submit(select_favourite_page, before_id, limit, callback=callback, error_callback=error_callback)
+
+    def search(self, dt=None):
+        self.record_list.search(self.search_input.text)
+
+    def search_records(self, text, limit, callback, error_callback):
+        db_worker.submit(search_favourite, text, limit, callback=callback, error_callback=error_callback)
+
+    def update(self, favourite_id):
+        record = record_cache.get("favourite", favourite_id)
+        if record is not None:
+            self.open_favourite(record)
+        else:
+            db_worker.submit(select_favourite, favourite_id, callback=for_current_profile(self.load_favourite_rows))
+
+    def load_favourite_rows(self, data):
+        db_worker.submit(select_record, "favourite", data[0],
+                         callback=for_current_profile(partial(self.cache_favourite, data)))
+
+    def cache_favourite(self, data, parsed):
+        record = record_cache.put("favourite", data[0], data[1], parsed)
+        rows = parsed[1]
+        # using a favourite logs it to history, once per cached entry since history drops duplicates anyway;
+        # deleting that history entry drops the cached one too
+        db_worker.submit(create_history, (datetime.today(), [(row[0], row[3], row[4]) for row in rows]))
+        self.open_favourite(record)
+
+    @timed()
+    def open_favourite(self, record):
+        s1 = get_screen("calculation")
+        s1.show_record(record)
+        s1.favourite_name.text = record[0]
         screen_manager.current = "calculation"
+        time_until_drawn("FavouriteScreen.open_favourite.drawn")
+
+    def remove_favourite(self, favourite_id):
+        record_cache.invalidate_record("favourite", favourite_id)
+        db_worker.submit(delete_favourite, favourite_id)
+
+    def remove_favourites(self, favourite_ids):
+        for favourite_id in favourite_ids:
+            record_cache.invalidate_record("favourite", favourite_id)
+        db_worker.submit(delete_favourites, favourite_ids)
+
+    def change_view(self, instance=None):
+        if instance == self.btn_change_view_home:
+            screen_manager.current = "home"
+
+
+class ReportScreen(Screen):
+    def __init__(self, **kwargs):
+        from kivy.uix.recycleview import RecycleView
+        from kivy.uix.recycleboxlayout import RecycleBoxLayout
+
+        super().__init__(**kwargs)
+        self.float_layout = FloatLayout()
+
+        self.btn_change_view_home = Button(text="Menu",
+                                           pos_hint={"x": 0, "y": 0.95},
+                                           size_hint=(1, 0.05),
+                                           on_press=self.change_view)
+        self.float_layout.add_widget(self.btn_change_view_home)
+
+        self.btn_day = Button(text="Day",
+                              pos_hint={"x": 0, "y": 0.9},
+                              size_hint=(0.2, 0.05),
+                              on_press=self.load_report)
+        self.float_layout.add_widget(self.btn_day)
+
+        self.btn_month = Button(text="Month",
+                                pos_hint={"x": 0.2, "y": 0.9},
+                                size_hint=(0.2, 0.05),
+                                on_press=self.load_report)
+        self.float_layout.add_widget(self.btn_month)
+
+        self.btn_year = Button(text="Year",
+                               pos_hint={"x": 0.4, "y": 0.9},
+                               size_hint=(0.2, 0.05),
+                               on_press=self.load_report)
+        self.float_layout.add_widget(self.btn_year)
+
+        self.btn_devices = Button(text="Top devices",
+                                  pos_hint={"x": 0.6, "y": 0.9},
+                                  size_hint=(0.2, 0.05),
+                                  on_press=self.load_report)
+        self.float_layout.add_widget(self.btn_devices)
+
+        self.btn_profiles = Button(text="All profiles",
+                                   pos_hint={"x": 0.8, "y": 0.9},
+                                   size_hint=(0.2, 0.05),
+                                   on_press=self.load_report)
+        self.float_layout.add_widget(self.btn_profiles)
+
+        self.report = RecycleView(size_hint=(1, None),
+                                  size=(Window.width, 0.9 * Window.height-10),
+                                  pos_hint={"x": 0, "y": 0})
+        layout = RecycleBoxLayout(orientation="vertical",
+                                  default_size=(None, Window.height / 20),
+                                  default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter("height"))
+        self.report.add_widget(layout)
+        self.report.viewclass = "Label"
+        self.float_layout.add_widget(self.report)
 
-    def remove_favourite(self, instance):
-        for record in self.button_list:
-            if instance == record[1]:
-                cur = connection.cursor()
-                cur.execute("SELECT * FROM favourite WHERE name=?", (record[0].text,))
-                rows = cur.fetchall()
-                if rows:
-                    favourite_record = rows[0][0]
-                    cur.execute('DELETE FROM favourite WHERE id=?', (favourite_record,))
-                    connection.commit()
-
-                self.layout.remove_widget(record[0])
-                self.layout.remove_widget(record[1])
-                self.button_list.remove(record)
+        self.add_widget(self.float_layout)
+
+    @timed()
+    def load_report(self, instance=None):
+        from reporting import consumption_by_period, top_devices
+
+        if instance == self.btn_devices:
+            db_worker.submit(top_devices, 50, callback=self.show_devices)
+        elif instance == self.btn_day:
+            db_worker.submit(consumption_by_period, "day", callback=self.show_periods)
+        elif instance == self.btn_month:
+            db_worker.submit(consumption_by_period, "month", callback=self.show_periods)
+        elif instance == self.btn_year:
+            db_worker.submit(consumption_by_period, "year", callback=self.show_periods)
+        elif instance == self.btn_profiles:
+            # every profile is attached to the current connection instead of opening one connection each
+            profiles = [(name, profile_path(name)) for name in list_profiles()]
+            db_worker.submit(total_by_profile, profiles, callback=self.show_profiles)
+
+    @timed()
+    def show_periods(self, rows):
+        self.report.data = [{"text": f"{bucket}    {round(energy, 2)} kWh"} for bucket, energy in reversed(rows)]
+
+    @timed()
+    def show_devices(self, rows):
+        self.report.data = [{"text": f"{device_label(name, power)}    {round(energy, 2)} kWh"}
+                            for device_id, name, power, energy in rows]
+
+    @timed()
+    def show_profiles(self, rows):
+        self.report.data = [{"text": f"{name}    {round(energy, 2)} kWh"} for name, energy in rows]
 
     def change_view(self, instance=None):
         if instance == self.btn_change_view_home:
@@ -580,16 +715,111 @@ class FavouriteScreen(Screen):
 
 screen_manager = ScreenManager(transition=NoTransition())
 
-screen_manager.add_widget(HomeScreen(name='home'))
-screen_manager.add_widget(CalculationScreen(name='calculation'))
-screen_manager.add_widget(HistoryScreen(name='history'))
-screen_manager.add_widget(FavouriteScreen(name='favourite'))
+screen_classes = {
+    "home": HomeScreen,
+    "calculation": CalculationScreen,
+    "history": HistoryScreen,
+    "favourite": FavouriteScreen,
+    "report": ReportScreen,
+}
+
+
+def switch_profile(name):
+    db_worker.switch(profile_path(name))
+    # record ids and device ids belong to the previous profile's database
+    record_cache.clear()
+    # lists and reports reload on every visit, only the device catalog is kept between visits
+    if screen_manager.has_screen("calculation"):
+        get_screen("calculation").reload_devices()
+
+
+def run_retention(dt=None):
+    from retention import select_retention
+
+    db_worker.submit(select_retention, callback=partial(start_retention, db_worker.db_file))
+
+
+def start_retention(db_file, keep_days):
+    from retention import retention_cutoff
+
+    if keep_days is not None:
+        roll_up_step(db_file, retention_cutoff(keep_days))
+
+
+def roll_up_step(db_file, cutoff, data_hashes=None):
+    from retention import roll_up_history, vacuum
+
+    # one chunk per request, so screens' queries get their turn in between
+    for data_hash in data_hashes or ():
+        record_cache.discard(data_hash)
+    if db_worker.db_file != db_file:
+        # the profile changed, its own policy applies on the next run
+        return
+    if data_hashes is None or len(data_hashes) == retention_chunk:
+        db_worker.submit(roll_up_history, cutoff, retention_chunk, callback=partial(roll_up_step, db_file, cutoff))
+    else:
+        db_worker.submit(vacuum)
+
+
+def run_sync(dt=None):
+    global sync_thread
+    # a sync still waiting for the server is not started twice
+    if sync_thread is not None and sync_thread.is_alive():
+        return
+    sync_thread = threading.Thread(target=sync_in_background, args=(db_worker.db_file,), daemon=True)
+    sync_thread.start()
+
+
+def sync_in_background(db_file):
+    # the HTTP requests wait on this thread, the database worker only gets the steps that read or apply changes
+    # (urllib and http are only loaded when syncing is configured)
+    from sync import sync_through
+
+    try:
+        result = sync_through(lambda func, *args: db_worker.submit(func, *args, db_file=db_file).result(), sync_url)
+    except Exception as e:
+        print(e)
+        return
+    Clock.schedule_once(lambda dt: synced(db_file, result))
+
+
+def synced(db_file, result):
+    sent, received, removed_devices, removed_favourites = result
+    if not received or db_worker.db_file != db_file:
+        return
+    # devices never change power, so only records using a removed device or a removed favourite are stale
+    for device_id in removed_devices:
+        record_cache.invalidate_device(device_id)
+    for favourite_id in removed_favourites:
+        record_cache.invalidate_record("favourite", favourite_id)
+    if screen_manager.has_screen("calculation"):
+        calculation = get_screen("calculation")
+        calculation.catalog.clear()
+        db_worker.submit(select_all_device, callback=for_current_profile(calculation.catalog.load))
+
+
+@timed()
+def get_screen(name):
+    # screens are built on first navigation instead of at startup
+    if not screen_manager.has_screen(name):
+        screen_manager.add_widget(screen_classes[name](name=name))
+    return screen_manager.get_screen(name)
 
 
 class MyApp(App):
     def build(self):
+        db_worker.start()
+        get_screen("home")
+        Clock.schedule_once(run_retention, 10)
+        Clock.schedule_interval(run_retention, retention_interval)
+        if sync_url:
+            Clock.schedule_once(run_sync)
+            Clock.schedule_interval(run_sync, sync_interval)
         return screen_manager
 
+    def on_stop(self):
+        db_worker.stop()
+
 
 if __name__ == '__main__':
     MyApp().run()
@@ -0,0 +1,128 @@
+import os
+import re
+import sqlite3
+from collections import OrderedDict
+
+from database import create_connection, migrate
+from instrumentation import timed
+from reporting import periods, first_day, last_day
+
+default_profile = "default"
+# the default profile keeps the database file single-site installs already have
+default_database = "database.db"
+profile_directory = "profiles"
+
+
+def valid_profile_name(name):
+    # names become file names, so no separators or dots
+    return re.fullmatch(r"[\w\- ]+", name) is not None
+
+
+def profile_path(name, directory=profile_directory):
+    if name == default_profile:
+        return default_database
+    return os.path.join(directory, f"{name}.db")
+
+
+def list_profiles(directory=profile_directory):
+    names = []
+    if os.path.isdir(directory):
+        names = sorted(file[:-3] for file in os.listdir(directory) if file.endswith(".db"))
+
+    return [default_profile] + [name for name in names if name != default_profile]
+
+
+def create_profile(name, directory=profile_directory):
+    if not valid_profile_name(name):
+        raise ValueError(f"invalid profile name: {name!r}")
+    os.makedirs(directory, exist_ok=True)
+
+    return profile_path(name, directory)
+
+
+class ConnectionPool:
+    # connections are created lazily and the least recently used one is closed once the pool is full;
+    # sqlite connections belong to the thread that opened them, so a pool is used from one thread only
+    def __init__(self, max_connections=8):
+        self.max_connections = max_connections
+        self.connections = OrderedDict()
+
+    def get(self, db_file):
+        connection = self.connections.get(db_file)
+        if connection is not None:
+            self.connections.move_to_end(db_file)
+            return connection
+
+        connection = create_connection(db_file)
+        if connection is None:
+            return None
+        migrate(connection)
+
+        self.connections[db_file] = connection
+        while len(self.connections) > self.max_connections:
+            _, oldest = self.connections.popitem(last=False)
+            oldest.close()
+
+        return connection
+
+    def close(self):
+        while self.connections:
+            _, connection = self.connections.popitem()
+            connection.close()
+
+
+def attach_batches(connection_to_db, profiles):
+    # one connection can only attach SQLITE_LIMIT_ATTACHED databases at a time, larger comparisons go in batches
+    batch_size = connection_to_db.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    for offset in range(0, len(profiles), batch_size):
+        attached = []
+        try:
+            for index, (name, db_file) in enumerate(profiles[offset:offset + batch_size]):
+                schema = f"profile_{index}"
+                connection_to_db.execute(f"ATTACH DATABASE ? AS {schema}", (db_file,))
+                attached.append((schema, name))
+            yield [(schema, name) for schema, name in attached if has_summary(connection_to_db, schema)]
+        finally:
+            for schema, name in attached:
+                connection_to_db.execute(f"DETACH DATABASE {schema}")
+
+
+def has_summary(connection_to_db, schema):
+    # files that were never opened by the app have no schema yet
+    cur = connection_to_db.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name='history_daily'")
+    return cur.fetchone() is not None
+
+
+def aggregate(connection_to_db, profiles, select_sql, params):
+    # select_sql reads {schema}.history_daily and starts its columns with the profile name
+    rows = []
+    for batch in attach_batches(connection_to_db, list(profiles)):
+        if not batch:
+            continue
+        sql = " UNION ALL ".join(select_sql.format(schema=schema) for schema, name in batch)
+        cur = connection_to_db.execute(sql, [value for schema, name in batch for value in (name, *params)])
+        rows.extend(cur.fetchall())
+
+    return rows
+
+
+@timed()
+def consumption_by_profile(connection_to_db, profiles, period="month", start=None, end=None):
+    # profiles are (name, db_file) pairs, rows come back as (name, bucket, energy)
+    sql = ''' SELECT ?, substr(day, 1, ?) AS bucket, SUM(energy)
+              FROM {schema}.history_daily
+              WHERE day >= ? AND day < ?
+              GROUP BY bucket '''
+    rows = aggregate(connection_to_db, profiles, sql, (periods[period], start or first_day, end or last_day))
+
+    return sorted(rows, key=lambda row: (row[0], row[1]))
+
+
+@timed()
+def total_by_profile(connection_to_db, profiles, start=None, end=None):
+    sql = ''' SELECT ?, SUM(energy)
+              FROM {schema}.history_daily
+              WHERE day >= ? AND day < ? '''
+    rows = aggregate(connection_to_db, profiles, sql, (start or first_day, end or last_day))
+
+    return sorted(((name, energy or 0) for name, energy in rows), key=lambda row: row[1], reverse=True)
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+from database import record_hash, select_history_rows, select_favourite_rows
+
+
+def parse_record(rows):
+    # (content hash, rows, row kWh, total kWh) of rows as select_history_rows returns them,
+    # (device_id, name, power, count, hours); heavy enough for large records to run on the database worker
+    from calculation import compute_consumption
+
+    row_values, total = compute_consumption([row[3] for row in rows], [row[4] for row in rows],
+                                            [row[2] for row in rows])
+    return record_hash([(row[0], row[3], row[4]) for row in rows]), rows, row_values.tolist(), total
+
+
+def select_record(connection_to_db, table, record_id):
+    if table == "history":
+        return parse_record(select_history_rows(connection_to_db, record_id))
+    return parse_record(select_favourite_rows(connection_to_db, record_id))
+
+
+class RecordCache:
+    # parsed rows and their kWh, keyed by the record's content hash so history entries and favourites with the
+    # same rows share one entry; records maps (table, record id) to (content hash, record name)
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.records = {}
+        self.record_keys = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, table, record_id):
+        # (name, rows, row values, total) of a record opened before, or None
+        data_hash, name = self.records.get((table, record_id), (None, None))
+        entry = self.entries.get(data_hash)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(data_hash)
+        return (name, *entry)
+
+    def put(self, table, record_id, name, parsed):
+        # parsed is what parse_record returns
+        data_hash, rows, row_values, total = parsed
+        self.records[(table, record_id)] = (data_hash, name)
+        self.record_keys.setdefault(data_hash, set()).add((table, record_id))
+
+        entry = self.entries.get(data_hash)
+        if entry is None:
+            entry = (rows, row_values, total)
+            self.entries[data_hash] = entry
+            while len(self.entries) > self.max_entries:
+                self.discard(next(iter(self.entries)))
+                self.evictions += 1
+        else:
+            self.entries.move_to_end(data_hash)
+
+        return (name, *entry)
+
+    def discard(self, data_hash):
+        self.entries.pop(data_hash, None)
+        for key in self.record_keys.pop(data_hash, ()):
+            self.records.pop(key, None)
+
+    def invalidate_record(self, table, record_id):
+        data_hash, name = self.records.get((table, record_id), (None, None))
+        if data_hash is not None:
+            self.discard(data_hash)
+
+    def invalidate_device(self, device_id):
+        # a device's power is part of every cached kWh figure it appears in
+        for data_hash, (rows, row_values, total) in list(self.entries.items()):
+            if any(row[0] == device_id for row in rows):
+                self.discard(data_hash)
+
+    def clear(self):
+        self.entries.clear()
+        self.records.clear()
+        self.record_keys.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
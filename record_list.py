@@ -0,0 +1,151 @@
+from functools import partial
+
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.checkbox import CheckBox
+from kivy.core.window import Window
+from kivy.properties import StringProperty, NumericProperty, BooleanProperty
+
+from instrumentation import timed, time_until_drawn
+
+# imported by the history and favourite screens when they are first built, not at startup
+
+
+class RecordRow(RecycleDataViewBehavior, BoxLayout):
+    text = StringProperty("")
+    record_id = NumericProperty(0)
+    selected = BooleanProperty(False)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.index = 0
+        self.record_list = None
+        self.spacing = 10
+
+        self.check_selected = CheckBox(size_hint_x=None,
+                                       width=40)
+        self.bind(selected=self.check_selected.setter("active"))
+        self.check_selected.bind(active=self.select_record)
+        self.add_widget(self.check_selected)
+
+        self.btn_open = Button(on_press=self.open_record)
+        self.bind(text=self.btn_open.setter("text"))
+        self.add_widget(self.btn_open)
+
+        self.btn_remove = Button(text="X",
+                                 size_hint_x=None,
+                                 width=40,
+                                 on_press=self.remove_record)
+        self.add_widget(self.btn_remove)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.record_list = rv
+        return super().refresh_view_attrs(rv, index, data)
+
+    def open_record(self, instance):
+        self.record_list.open_record(self.record_id)
+
+    def select_record(self, instance, value):
+        if self.record_list is not None:
+            self.record_list.select(self.index, value)
+
+    def remove_record(self, instance):
+        self.record_list.remove_record(self.index)
+
+
+class RecordList(RecycleView):
+    def __init__(self, load_page, open_record, remove_record, remove_records=None, search_records=None,
+                 page_size=50, **kwargs):
+        super().__init__(**kwargs)
+        self.load_page = load_page
+        self.search_records = search_records
+        self.open_record = open_record
+        self.remove_record_callback = remove_record
+        self.remove_records_callback = remove_records
+        self.page_size = page_size
+        self.has_more = True
+        self.loading = False
+        self.generation = 0
+
+        layout = RecycleBoxLayout(orientation="vertical",
+                                  spacing=10,
+                                  default_size=(None, Window.height / 20),
+                                  default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter("height"))
+        self.add_widget(layout)
+        self.viewclass = RecordRow
+
+        self.bind(scroll_y=self.on_scroll)
+
+    def reload(self):
+        self.data = []
+        self.has_more = True
+        self.loading = False
+        self.generation += 1
+        self.load_more()
+
+    def load_more(self):
+        if self.loading:
+            return
+        self.loading = True
+        before_id = self.data[-1]["record_id"] if self.data else None
+        self.load_page(before_id, self.page_size, partial(self.page_loaded, self.generation),
+                       partial(self.page_failed, self.generation))
+
+    @timed()
+    def page_loaded(self, generation, rows):
+        # pages requested before the last reload are stale
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.has_more = len(rows) == self.page_size
+        self.data.extend({"record_id": record[0], "text": str(record[1]), "selected": False} for record in rows)
+        time_until_drawn("RecordList.page_loaded.drawn")
+
+    def page_failed(self, generation, error):
+        # the next scroll to the bottom asks for the page again
+        if generation == self.generation:
+            self.loading = False
+
+    def search(self, text):
+        if not text.strip():
+            self.reload()
+            return
+        # search results are ranked, not ordered by id, so they come as one page
+        self.data = []
+        self.has_more = False
+        self.loading = True
+        self.generation += 1
+        self.search_records(text, self.page_size, partial(self.search_loaded, self.generation),
+                            partial(self.page_failed, self.generation))
+
+    @timed()
+    def search_loaded(self, generation, rows):
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.data = [{"record_id": record[0], "text": str(record[1]), "selected": False} for record in rows]
+
+    def on_scroll(self, instance, value):
+        # scroll_y reaches 0 at the bottom of the list
+        if self.has_more and value <= 0.05:
+            self.load_more()
+
+    def remove_record(self, index):
+        record = self.data.pop(index)
+        self.remove_record_callback(record["record_id"])
+
+    def select(self, index, selected):
+        # the dict is changed in place, the row already shows the new state
+        self.data[index]["selected"] = selected
+
+    def remove_selected(self, instance=None):
+        record_ids = [record["record_id"] for record in self.data if record["selected"]]
+        if record_ids:
+            self.data = [record for record in self.data if not record["selected"]]
+            self.remove_records_callback(record_ids)
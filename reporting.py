@@ -0,0 +1,43 @@
+from instrumentation import timed
+
+first_day = "0000-01-01"
+last_day = "9999-12-31"
+
+# length of the "YYYY-MM-DD" prefix that identifies each bucket
+periods = {
+    "day": 10,
+    "month": 7,
+    "year": 4,
+}
+
+
+@timed()
+def consumption_by_period(connection_to_db, period="day", start=None, end=None):
+    # history_daily is kept up to date by triggers, see database.migration_daily_summary
+    sql = ''' SELECT substr(day, 1, ?) AS bucket, SUM(energy)
+              FROM history_daily
+              WHERE day >= ? AND day < ?
+              GROUP BY bucket
+              ORDER BY bucket '''
+    cur = connection_to_db.cursor()
+    cur.execute(sql, (periods[period], start or first_day, end or last_day))
+    rows = cur.fetchall()
+
+    return rows
+
+
+@timed()
+def top_devices(connection_to_db, limit=10, start=None, end=None):
+    sql = ''' SELECT devices.id, devices.name, devices.power, totals.energy
+              FROM (SELECT device_id, SUM(energy) AS energy
+                    FROM history_daily
+                    WHERE day >= ? AND day < ?
+                    GROUP BY device_id) AS totals
+              JOIN devices ON devices.id = totals.device_id
+              ORDER BY totals.energy DESC
+              LIMIT ? '''
+    cur = connection_to_db.cursor()
+    cur.execute(sql, (start or first_day, end or last_day, limit))
+    rows = cur.fetchall()
+
+    return rows
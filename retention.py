@@ -0,0 +1,115 @@
+import argparse
+from datetime import date, timedelta
+from sqlite3 import Error
+
+from database import create_connection, migrate
+from instrumentation import timed
+
+
+def select_retention(connection_to_db):
+    # days of history to keep, None keeps everything
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT keep_days FROM history_retention WHERE id = 1")
+    row = cur.fetchone()
+
+    return row[0] if row else None
+
+
+def set_retention(connection_to_db, keep_days):
+    cur = connection_to_db.cursor()
+    cur.execute("UPDATE history_retention SET keep_days=? WHERE id = 1", (keep_days,))
+    connection_to_db.commit()
+
+
+def retention_cutoff(keep_days, today=None):
+    return ((today or date.today()) - timedelta(days=keep_days)).isoformat()
+
+
+@timed()
+def roll_up_history(connection_to_db, cutoff, limit=1000):
+    # deletes up to `limit` entries from before `cutoff` and returns their content hashes; their energy stays in
+    # history_daily because moving rolled_up_before first stops the delete trigger from subtracting it. Entries
+    # whose name is not a date were never counted there and are kept, name < ? only narrows the index scan
+    cur = connection_to_db.cursor()
+    try:
+        cur.execute("UPDATE history_retention SET rolled_up_before = max(rolled_up_before, ?) WHERE id = 1",
+                    (cutoff,))
+        cur.execute(''' DELETE FROM history
+                        WHERE id IN (SELECT id FROM history
+                                     WHERE name < ? AND date(name) IS NOT NULL AND date(name) < ?
+                                     ORDER BY name LIMIT ?)
+                        RETURNING data_hash ''', (cutoff, cutoff, limit))
+        data_hashes = [row[0] for row in cur.fetchall()]
+        connection_to_db.commit()
+    except Error:
+        connection_to_db.rollback()
+        raise
+
+    return data_hashes
+
+
+@timed()
+def vacuum(connection_to_db, pages=None):
+    # hands free pages back to the file system; files created before auto_vacuum was turned on
+    # need one full VACUUM first. Returns the number of free pages left
+    cur = connection_to_db.cursor()
+    cur.execute("PRAGMA auto_vacuum")
+    if cur.fetchone()[0] != 2:
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cur.execute("VACUUM")
+    else:
+        # executescript steps the pragma to the end, execute would only free the first page
+        connection_to_db.executescript(f"PRAGMA incremental_vacuum({int(pages or 0)});")
+    # the WAL file keeps the old pages until it is checkpointed
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    cur.execute("PRAGMA freelist_count")
+
+    return cur.fetchone()[0]
+
+
+def apply_retention(connection_to_db, keep_days=None, today=None, limit=1000):
+    # the whole job in one call, the app runs the same steps one request at a time on its database worker
+    keep_days = select_retention(connection_to_db) if keep_days is None else keep_days
+    if keep_days is None:
+        return 0
+
+    cutoff = retention_cutoff(keep_days, today)
+    removed = 0
+    while True:
+        data_hashes = roll_up_history(connection_to_db, cutoff, limit)
+        removed += len(data_hashes)
+        if len(data_hashes) < limit:
+            break
+    vacuum(connection_to_db)
+
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Set the history retention policy and apply it.")
+    parser.add_argument("--database", default="database.db")
+    parser.add_argument("--keep-days", type=int, help="store this many days of history and apply it now")
+    parser.add_argument("--keep-all", action="store_true", help="turn the retention policy off")
+    args = parser.parse_args(argv)
+
+    connection = create_connection(args.database)
+    if connection is None:
+        print("Error! cannot create the database connection.")
+        return 1
+    migrate(connection)
+
+    if args.keep_all:
+        set_retention(connection, None)
+    elif args.keep_days is not None:
+        set_retention(connection, args.keep_days)
+
+    removed = apply_retention(connection)
+    keep_days = select_retention(connection)
+    print(f"Rolled up {removed} history entries, keeping {'all' if keep_days is None else keep_days} days")
+
+    connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
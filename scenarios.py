@@ -0,0 +1,172 @@
+import argparse
+import heapq
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+
+from calculation import compute_consumption_batch
+from database import create_connection, migrate
+from transfer import chunked, iterate_records
+
+# a transformation is (kind, name, power, value): rows whose device name contains `name` (any device when
+# empty) and, if `power` is given, whose power equals it, get `value` added to their hours ("hours")
+# or their power replaced by `value` ("power")
+
+# arrays of every favourite row, set once per worker process by load_rows
+rows = None
+
+
+def parse_axis(kind, text):
+    # "fridge=-1,-2" or "bulb@60=9,12" -> one transformation per value
+    target, _, values = text.rpartition("=")
+    name, _, power = target.partition("@")
+    power = int(power) if power else None
+
+    return [(kind, name.strip().lower(), power, float(value)) for value in values.split(",")]
+
+
+def scenario_grid(axes):
+    # every combination of one transformation from each axis
+    return [list(scenario) for scenario in product(*axes)]
+
+
+def scenario_label(scenario):
+    parts = []
+    for kind, name, power, value in scenario:
+        target = (name or "all") + (f"@{power}" if power is not None else "")
+        parts.append(f"{target} {kind} {'%+g' % value if kind == 'hours' else '%g' % value}")
+
+    return ", ".join(parts)
+
+
+def favourite_rows(connection_to_db):
+    names = []
+    set_index, device_names, count, hours, power = [], [], [], [], []
+    for name, record in iterate_records(connection_to_db, "favourite"):
+        for device_name, device_power, device_count, device_hours in record:
+            set_index.append(len(names))
+            device_names.append(device_name)
+            count.append(device_count)
+            hours.append(device_hours)
+            power.append(device_power)
+        names.append(name)
+
+    return names, set_index, device_names, count, hours, power
+
+
+def load_rows(names, set_index, device_names, count, hours, power):
+    global rows
+    set_index = np.asarray(set_index, dtype=np.intp)
+    count = np.asarray(count, dtype=np.float64)
+    hours = np.asarray(hours, dtype=np.float64)
+    power = np.asarray(power, dtype=np.float64)
+    # device names repeat a lot, matching runs once per distinct name
+    unique_names, name_index = np.unique(np.asarray(device_names, dtype=str), return_inverse=True)
+    _, baseline = compute_consumption_batch(set_index, count, hours, power, len(names))
+
+    rows = {"names": names, "set_index": set_index, "count": count, "hours": hours, "power": power,
+            "unique_names": [name.lower() for name in unique_names.tolist()], "name_index": name_index,
+            "baseline": baseline}
+
+
+def row_mask(name, power):
+    matches = np.array([name in device_name for device_name in rows["unique_names"]], dtype=bool)
+    mask = matches[rows["name_index"]] if len(matches) else np.zeros(len(rows["count"]), dtype=bool)
+    if power is not None:
+        mask &= rows["power"] == power
+
+    return mask
+
+
+def evaluate(scenario, top=10):
+    hours = rows["hours"]
+    power = rows["power"]
+    for kind, name, device_power, value in scenario:
+        # masks are taken on the original rows, so transformations do not see each other's changes
+        mask = row_mask(name, device_power)
+        if kind == "hours":
+            hours = np.where(mask, np.clip(hours + value, 0, 24), hours)
+        else:
+            power = np.where(mask, value, power)
+
+    _, totals = compute_consumption_batch(rows["set_index"], rows["count"], hours, power, len(rows["names"]))
+    savings = rows["baseline"] - totals
+    best = np.argsort(-savings, kind="stable")[:top]
+
+    return {"scenario": scenario_label(scenario),
+            "baseline_kwh": round(float(rows["baseline"].sum()), 6),
+            "kwh": round(float(totals.sum()), 6),
+            "savings_kwh": round(float(savings.sum()), 6),
+            "favourites": [{"name": rows["names"][i],
+                            "baseline_kwh": round(float(rows["baseline"][i]), 6),
+                            "kwh": round(float(totals[i]), 6),
+                            "savings_kwh": round(float(savings[i]), 6)} for i in best.tolist()]}
+
+
+def evaluate_chunk(scenarios, top=10):
+    return [evaluate(scenario, top) for scenario in scenarios]
+
+
+def what_if(connection_to_db, scenarios, workers=None, chunk_size=64, top=10):
+    # yields one result per scenario as soon as its chunk is done, in completion order
+    data = favourite_rows(connection_to_db)
+    if workers == 0:
+        load_rows(*data)
+        for chunk in chunked(scenarios, chunk_size):
+            yield from evaluate_chunk(chunk, top)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_rows, initargs=data) as executor:
+        futures = [executor.submit(evaluate_chunk, chunk, top) for chunk in chunked(scenarios, chunk_size)]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def ranked(results, limit=None):
+    results = list(results)
+    if limit is None:
+        return sorted(results, key=lambda result: result["savings_kwh"], reverse=True)
+    return heapq.nlargest(limit, results, key=lambda result: result["savings_kwh"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate what-if scenarios over all saved favourites.")
+    parser.add_argument("--hours", action="append", default=[], metavar="NAME[@POWER]=DELTA,...",
+                        help="add DELTA hours a day to matching devices, e.g. fridge=-1,-2")
+    parser.add_argument("--power", action="append", default=[], metavar="NAME[@POWER]=WATTS,...",
+                        help="replace the power of matching devices, e.g. bulb@60=9,12")
+    parser.add_argument("--database", default="database.db")
+    parser.add_argument("--workers", type=int, help="process pool size, 0 evaluates in this process")
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--top", type=int, default=10, help="favourites listed per scenario")
+    parser.add_argument("--limit", type=int, help="only print the best LIMIT scenarios")
+    parser.add_argument("--stream", action="store_true",
+                        help="print each scenario as soon as it is evaluated instead of ranking them")
+    args = parser.parse_args(argv)
+
+    axes = [parse_axis("hours", text) for text in args.hours] + [parse_axis("power", text) for text in args.power]
+    if not axes:
+        parser.error("give at least one --hours or --power transformation")
+
+    connection = create_connection(args.database)
+    if connection is None:
+        print("Error! cannot create the database connection.")
+        return 1
+    migrate(connection)
+
+    results = what_if(connection, scenario_grid(axes), args.workers, args.chunk_size, args.top)
+    if not args.stream:
+        results = ranked(results, args.limit)
+    for result in results:
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+    connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,356 @@
+import argparse
+import json
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlite3 import Error
+from urllib.parse import urlencode, urlsplit, parse_qs
+
+from database import create_connection, create_table, migrate, insert_favourite
+from instrumentation import timed
+from transfer import DeviceResolver
+
+# seconds to wait for the sync server
+sync_timeout = 10
+
+# installs know devices and favourites by different ids, changes carry them by name (and power for devices):
+# {"table": "devices", "operation": "insert", "payload": {"name": ..., "power": ...}}
+# {"table": "favourite", "operation": "insert", "payload": {"name": ..., "rows": [{"device", "power", "count",
+# "hours"}, ...]}} and the same for "delete" without rows
+
+
+def select_sync_state(connection_to_db):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT client_id, pushed_version, pulled_version FROM sync_state WHERE id = 1")
+
+    return cur.fetchone()
+
+
+def local_changes(connection_to_db, since, limit=500):
+    # changes logged after version `since` and the last version read
+    cur = connection_to_db.cursor()
+    cur.execute(''' SELECT version, table_name, operation, row_id, payload FROM change_log
+                    WHERE version > ?
+                    ORDER BY version
+                    LIMIT ? ''', (since, limit))
+
+    changes = []
+    last_version = since
+    for version, table, operation, row_id, payload in cur.fetchall():
+        last_version = version
+        payload = json.loads(payload)
+        if table == "favourite" and operation == "insert":
+            rows_cur = connection_to_db.cursor()
+            rows_cur.execute("SELECT 1 FROM favourite WHERE id=?", (row_id,))
+            if rows_cur.fetchone() is None:
+                # deleted since, the delete is further down the log
+                continue
+            rows_cur.execute(''' SELECT devices.name, devices.power, favourite_rows.count, favourite_rows.hours
+                                 FROM favourite_rows JOIN devices ON devices.id = favourite_rows.device_id
+                                 WHERE favourite_rows.favourite_id=?
+                                 ORDER BY favourite_rows.id ''', (row_id,))
+            payload["rows"] = [{"device": device, "power": power, "count": count, "hours": hours}
+                               for device, power, count, hours in rows_cur.fetchall()]
+        changes.append({"table": table, "operation": operation, "payload": payload})
+
+    return changes, last_version
+
+
+def mark_pushed(connection_to_db, version):
+    # the server has everything up to `version`, the log does not need it any more
+    cur = connection_to_db.cursor()
+    cur.execute("UPDATE sync_state SET pushed_version=? WHERE id = 1", (version,))
+    cur.execute("DELETE FROM change_log WHERE version <= ?", (version,))
+    connection_to_db.commit()
+
+
+def valid_change(change):
+    # the shape apply_changes relies on, changes from the server that do not have it are skipped
+    if not isinstance(change, dict) or not isinstance(change.get("payload"), dict):
+        return False
+    table, operation, payload = change.get("table"), change.get("operation"), change["payload"]
+    if operation not in ("insert", "delete") or not isinstance(payload.get("name"), str):
+        return False
+    if table == "devices":
+        return isinstance(payload.get("power"), int)
+    if table != "favourite":
+        return False
+    if operation == "delete":
+        return True
+
+    rows = payload.get("rows")
+    return isinstance(rows, list) and all(isinstance(row, dict) and isinstance(row.get("device"), str) and
+                                          all(isinstance(row.get(key), int) for key in ("power", "count", "hours"))
+                                          for row in rows)
+
+
+def apply_change(cur, resolver, change):
+    # returns the ids of the devices and favourites the change removed
+    payload = change["payload"]
+    if change["table"] == "devices":
+        if change["operation"] == "insert":
+            resolver.resolve(payload["name"], payload["power"])
+            return [], []
+        # devices still used by history, favourites or the daily summary here are kept
+        cur.execute(''' DELETE FROM devices
+                        WHERE name=? AND power=?
+                          AND id NOT IN (SELECT device_id FROM history_rows)
+                          AND id NOT IN (SELECT device_id FROM favourite_rows)
+                          AND id NOT IN (SELECT device_id FROM history_daily)
+                        RETURNING id ''', (payload["name"], payload["power"]))
+        device_ids = [row[0] for row in cur.fetchall()]
+        if device_ids:
+            resolver.device_ids.pop((payload["name"], payload["power"]), None)
+        return device_ids, []
+
+    if change["operation"] == "insert":
+        rows = [(row["device"], row["power"], row["count"], row["hours"]) for row in payload["rows"]]
+        insert_favourite(cur, resolver.record((payload["name"], rows)))
+        return [], []
+    cur.execute("DELETE FROM favourite WHERE name=? RETURNING id", (payload["name"],))
+    return [], [row[0] for row in cur.fetchall()]
+
+
+def apply_changes(connection_to_db, changes, pulled_version=None):
+    # applying a change twice does nothing, so a batch interrupted before its watermark was saved can be re-pulled.
+    # Each change gets a savepoint: one that is malformed or fails is skipped instead of holding the watermark back.
+    # Returns (changes applied, ids of removed devices, ids of removed favourites)
+    cur = connection_to_db.cursor()
+    applied = 0
+    removed_devices = []
+    removed_favourites = []
+    try:
+        cur.execute("UPDATE sync_state SET applying = 1 WHERE id = 1")
+        resolver = DeviceResolver(connection_to_db)
+        for change in changes:
+            if not valid_change(change):
+                print(f"Skipping malformed change: {change!r}")
+                continue
+            cur.execute("SAVEPOINT change")
+            try:
+                device_ids, favourite_ids = apply_change(cur, resolver, change)
+            except Error as e:
+                print(e)
+                cur.execute("ROLLBACK TO change")
+                cur.execute("RELEASE change")
+                resolver.rolled_back()
+                continue
+            cur.execute("RELEASE change")
+            resolver.committed()
+            applied += 1
+            removed_devices.extend(device_ids)
+            removed_favourites.extend(favourite_ids)
+        cur.execute("UPDATE sync_state SET applying = 0 WHERE id = 1")
+        if pulled_version is not None:
+            cur.execute("UPDATE sync_state SET pulled_version=? WHERE id = 1", (pulled_version,))
+        connection_to_db.commit()
+    except Exception:
+        # whatever went wrong, applying must not stay set or local changes would stop being logged
+        connection_to_db.rollback()
+        raise
+
+    return applied, removed_devices, removed_favourites
+
+
+def request(url, path, body=None):
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    sync_request = urllib.request.Request(url.rstrip("/") + path, data=data,
+                                          headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(sync_request, timeout=sync_timeout) as response:
+        return json.loads(response.read())
+
+
+@timed()
+def sync_through(run, url, batch_size=500):
+    # pushes local changes, then pulls everyone else's. run(func, *args) calls func with the database connection
+    # first, in the app on its database worker, so only the database steps wait there and never the HTTP requests.
+    # Returns (changes sent, changes received, ids of removed devices, ids of removed favourites)
+    client_id, pushed_version, pulled_version = run(select_sync_state)
+
+    sent = 0
+    while True:
+        changes, last_version = run(local_changes, pushed_version, batch_size)
+        if last_version == pushed_version:
+            break
+        if changes:
+            request(url, "/push", {"client": client_id, "changes": changes})
+        run(mark_pushed, last_version)
+        pushed_version = last_version
+        sent += len(changes)
+
+    received = 0
+    removed_devices = []
+    removed_favourites = []
+    while True:
+        query = urlencode({"client": client_id, "since": pulled_version, "limit": batch_size})
+        response = request(url, f"/pull?{query}")
+        if response["version"] == pulled_version:
+            break
+        applied, device_ids, favourite_ids = run(apply_changes, response["changes"], response["version"])
+        pulled_version = response["version"]
+        received += applied
+        removed_devices.extend(device_ids)
+        removed_favourites.extend(favourite_ids)
+
+    return sent, received, removed_devices, removed_favourites
+
+
+def sync(connection_to_db, url, batch_size=500):
+    return sync_through(lambda func, *args: func(connection_to_db, *args), url, batch_size)
+
+
+sql_create_sync_log_table = """CREATE TABLE IF NOT EXISTS sync_log (
+                                    version integer PRIMARY KEY,
+                                    origin text NOT NULL,
+                                    table_name text NOT NULL,
+                                    operation text NOT NULL,
+                                    payload text NOT NULL
+                                );"""
+
+
+def push_changes(connection_to_db, client_id, changes):
+    cur = connection_to_db.cursor()
+    cur.executemany("INSERT INTO sync_log(origin, table_name, operation, payload) VALUES(?,?,?,?)",
+                    [(client_id, change["table"], change["operation"], json.dumps(change["payload"]))
+                     for change in changes])
+    connection_to_db.commit()
+
+    return cur.lastrowid
+
+
+def pull_changes(connection_to_db, client_id, since, limit=500):
+    # the client's own changes are skipped but still count towards the version it gets back
+    cur = connection_to_db.cursor()
+    cur.execute(''' SELECT version, origin, table_name, operation, payload FROM sync_log
+                    WHERE version > ?
+                    ORDER BY version
+                    LIMIT ? ''', (since, limit))
+
+    changes = []
+    last_version = since
+    for version, origin, table, operation, payload in cur.fetchall():
+        last_version = version
+        if origin != client_id:
+            changes.append({"table": table, "operation": operation, "payload": json.loads(payload)})
+
+    return changes, last_version
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/pull":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        try:
+            client_id = query["client"][0]
+            since = int(query.get("since", ["0"])[0])
+            limit = min(int(query.get("limit", ["500"])[0]), 5000)
+        except (KeyError, ValueError):
+            self.send_error(400)
+            return
+
+        with self.server.lock:
+            connection = create_connection(self.server.db_file)
+            changes, version = pull_changes(connection, client_id, since, limit)
+            connection.close()
+        self.send_json({"changes": changes, "version": version})
+
+    def do_POST(self):
+        if self.path != "/push":
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            client_id = body["client"]
+            changes = body["changes"]
+            if not isinstance(client_id, str) or not all(valid_change(change) for change in changes):
+                raise ValueError("malformed changes")
+        except (KeyError, TypeError, ValueError):
+            self.send_error(400)
+            return
+
+        with self.server.lock:
+            connection = create_connection(self.server.db_file)
+            version = push_changes(connection, client_id, changes)
+            connection.close()
+        self.send_json({"version": version})
+
+    def send_json(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SyncServer(ThreadingHTTPServer):
+    # the hub every install pushes to and pulls from; port 0 picks a free port, see server_address
+    def __init__(self, db_file, host="127.0.0.1", port=8765):
+        super().__init__((host, port), SyncHandler)
+        self.db_file = db_file
+        # one request at a time touches the log
+        self.lock = threading.Lock()
+        self.thread = None
+
+        connection = create_connection(db_file)
+        create_table(connection, sql_create_sync_log_table)
+        connection.close()
+
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share devices and favourites between installs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="run the sync server")
+    serve.add_argument("--database", default="sync.db")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+
+    client = subparsers.add_parser("sync", help="exchange changes with a sync server")
+    client.add_argument("url")
+    client.add_argument("--database", default="database.db")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = SyncServer(args.database, args.host, args.port)
+        print(f"Serving {args.database} on {server.url()}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        return 0
+
+    connection = create_connection(args.database)
+    if connection is None:
+        print("Error! cannot create the database connection.")
+        return 1
+    migrate(connection)
+    sent, received, removed_devices, removed_favourites = sync(connection, args.url)
+    print(f"Sent {sent} changes, received {received}")
+    connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,140 @@
+import numpy as np
+
+from calculation import compute_consumption
+
+all_weekdays = 127
+
+
+def daily_load(count, hours, power, start_hour=0):
+    # kWh drawn in each hour of the day by rows running `hours` hours from `start_hour`, wrapping past midnight
+    count = np.asarray(count, dtype=np.float64)
+    hours = np.clip(np.asarray(hours, dtype=np.float64), 0, 24)
+    power = np.asarray(power, dtype=np.float64)
+    start = np.broadcast_to(np.asarray(start_hour, dtype=np.float64) % 24, count.shape)
+
+    slots = np.arange(48, dtype=np.float64)
+    on = (np.minimum(slots + 1, (start + hours)[:, None]) - np.maximum(slots, start[:, None])).clip(0, 1)
+    on = on[:, :24] + on[:, 24:]
+
+    return on * (count * power / 1000)[:, None]
+
+
+def hourly_rates(bands, base_rate=0, days=365, first_weekday=0):
+    # (days, 24) price of each hour; bands are (start_hour, end_hour, rate, weekdays) with end_hour exclusive
+    rates = np.full((days, 24), base_rate, dtype=np.float64)
+    weekday = (np.arange(days) + first_weekday) % 7
+    hour = np.arange(24)
+
+    for start_hour, end_hour, rate, weekdays in bands:
+        if start_hour <= end_hour:
+            in_band = (hour >= start_hour) & (hour < end_hour)
+        else:
+            in_band = (hour >= start_hour) | (hour < end_hour)
+        on_day = (weekdays >> weekday) & 1 == 1
+        rates[np.ix_(on_day, in_band)] = rate
+
+    return rates
+
+
+def tiered_cost(energy, tiers):
+    # tiers are (up_to, rate) in increasing order, the last up_to may be None for no limit
+    total = float(np.sum(energy))
+    lower = 0
+    cost = 0
+    for up_to, rate in tiers:
+        upper = np.inf if up_to is None else up_to
+        cost += max(0, min(total, upper) - lower) * rate
+        lower = upper
+
+    return cost
+
+
+class Tariff:
+    def __init__(self, name, kind, rate=0, tiers=(), bands=()):
+        self.name = name
+        self.kind = kind
+        self.rate = rate
+        self.tiers = list(tiers)
+        self.bands = list(bands)
+
+    def cost(self, count, hours, power, days=1, start_hour=0, first_weekday=0):
+        # per-row and total cost of rows as save computes them (hours per day), over `days` days
+        if self.kind == "time_of_use":
+            load = daily_load(count, hours, power, start_hour)
+            rates = hourly_rates(self.bands, self.rate, days, first_weekday)
+            # every day repeats the same profile, so one product against the summed rates covers the period
+            rows = load @ rates.sum(axis=0)
+            return rows, float(rows.sum())
+
+        rows, total = compute_consumption(count, hours, power)
+        rows = rows * days
+        if self.kind == "tiered":
+            cost = tiered_cost(rows, self.tiers)
+            # tier charges follow total consumption, each row pays its share of the energy
+            rows = rows * (cost / (total * days)) if total else rows * 0
+            return rows, cost
+
+        rows = rows * self.rate
+        return rows, float(rows.sum())
+
+    def load_cost(self, load, first_weekday=0):
+        # per-row and total cost of a (rows, hours) kWh load curve starting at midnight
+        load = np.asarray(load, dtype=np.float64)
+        if self.kind == "time_of_use":
+            days = -(-load.shape[1] // 24)
+            rates = hourly_rates(self.bands, self.rate, days, first_weekday).ravel()[:load.shape[1]]
+            rows = load @ rates
+            return rows, float(rows.sum())
+
+        rows = load.sum(axis=1)
+        if self.kind == "tiered":
+            cost = tiered_cost(rows, self.tiers)
+            total = rows.sum()
+            rows = rows * (cost / total) if total else rows * 0
+            return rows, cost
+
+        rows = rows * self.rate
+        return rows, float(rows.sum())
+
+
+def create_tariff(connection_to_db, tariff):
+    cur = connection_to_db.cursor()
+    cur.execute("INSERT INTO tariffs(name,kind,rate) VALUES(?,?,?)", (tariff.name, tariff.kind, tariff.rate))
+    tariff_id = cur.lastrowid
+    cur.executemany("INSERT INTO tariff_tiers(tariff_id,up_to,rate) VALUES(?,?,?)",
+                    [(tariff_id, *tier) for tier in tariff.tiers])
+    cur.executemany("INSERT INTO tariff_bands(tariff_id,start_hour,end_hour,rate,weekdays) VALUES(?,?,?,?,?)",
+                    [(tariff_id, *band) for band in tariff.bands])
+    connection_to_db.commit()
+
+    return tariff_id
+
+
+def select_tariff(connection_to_db, name):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT id, name, kind, rate FROM tariffs WHERE name=?", (name,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+
+    # unbounded tiers (NULL up_to) sort last
+    cur.execute("SELECT up_to, rate FROM tariff_tiers WHERE tariff_id=? ORDER BY up_to IS NULL, up_to", (row[0],))
+    tiers = cur.fetchall()
+    cur.execute("SELECT start_hour, end_hour, rate, weekdays FROM tariff_bands WHERE tariff_id=? ORDER BY id",
+                (row[0],))
+    bands = cur.fetchall()
+
+    return Tariff(row[1], row[2], row[3], tiers, bands)
+
+
+def select_all_tariff(connection_to_db):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT name FROM tariffs ORDER BY name")
+
+    return [select_tariff(connection_to_db, name) for (name,) in cur.fetchall()]
+
+
+def delete_tariff(connection_to_db, name):
+    cur = connection_to_db.cursor()
+    cur.execute("DELETE FROM tariffs WHERE name=?", (name,))
+    connection_to_db.commit()
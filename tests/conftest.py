@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# the modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import create_connection, migration_create_tables  # noqa: E402
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    # a database as the app wrote it before migrations: records are "<rows>|<count>|<hours>|<label>|..." text
+    def make(devices=(), history=(), favourites=()):
+        db_file = str(tmp_path / "legacy.db")
+        conn = create_connection(db_file)
+        migration_create_tables(conn)
+        conn.executemany("INSERT INTO devices(name,power) VALUES(?,?)", devices)
+        conn.executemany("INSERT INTO history(name,data) VALUES(?,?)", history)
+        conn.executemany("INSERT INTO favourite(name,data) VALUES(?,?)", favourites)
+        conn.commit()
+        return conn
+
+    return make
@@ -0,0 +1,30 @@
+from sqlite3 import Error
+
+import pytest
+
+from database import (create_connection, migrate, create_device, create_history, create_favourite,
+                      select_history_rows)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = create_connection(str(tmp_path / "database.db"))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def test_failed_record_insert_is_rolled_back(conn):
+    fridge = create_device(conn, ("Fridge", 150))
+
+    with pytest.raises(Error):
+        create_history(conn, ("2024-01-01 10:00:00", [(fridge, 1, 24), (9999, 1, 1)]))
+    with pytest.raises(Error):
+        create_favourite(conn, ("kitchen", [(fridge, 1, 24), (9999, 1, 1)]))
+    # the next commit on the connection does not save the half-written records
+    create_device(conn, ("TV", 50))
+
+    assert conn.execute("SELECT count(*) FROM history").fetchone() == (0,)
+    assert conn.execute("SELECT count(*) FROM favourite").fetchone() == (0,)
+    history_id = create_history(conn, ("2024-01-01 10:00:00", [(fridge, 1, 24)]))
+    assert [row[3:] for row in select_history_rows(conn, history_id)] == [(1, 24)]
@@ -0,0 +1,28 @@
+import pytest
+
+from database import create_connection, migrate, create_device, select_all_device
+from db_worker import DatabaseWorker
+
+
+@pytest.fixture
+def worker(tmp_path):
+    db_file = str(tmp_path / "database.db")
+    conn = create_connection(db_file)
+    migrate(conn)
+    conn.close()
+    worker = DatabaseWorker(db_file)
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+def test_failed_request_is_rolled_back(worker):
+    def half_written(conn):
+        conn.execute("INSERT INTO devices(name,power) VALUES ('Fridge', 150)")
+        raise ValueError("stopped half way")
+
+    with pytest.raises(ValueError):
+        worker.submit(half_written).result()
+    worker.submit(create_device, ("TV", 50)).result()
+
+    assert [device[1:] for device in worker.submit(select_all_device).result()] == [("TV", 50)]
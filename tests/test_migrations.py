@@ -0,0 +1,113 @@
+from datetime import datetime
+
+import pytest
+
+from database import (create_connection, migrate, migrations, parse_legacy_record, create_device, create_history,
+                      delete_history)
+from transfer import import_history
+
+
+def test_migrate_reaches_latest_version(legacy_db):
+    conn = legacy_db()
+    migrate(conn)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(migrations)
+    # running it again is a no-op
+    migrate(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(migrations)
+
+
+def test_lookup_indexes_drop_duplicates(legacy_db):
+    conn = legacy_db(devices=[("Fridge", 150)],
+                     history=[("2024-01-01 10:00:00", "1|1|24|Fridge 150 W|"),
+                              ("2024-01-02 10:00:00", "1|1|24|Fridge 150 W|"),
+                              ("2024-01-03 10:00:00", "1|2|24|Fridge 150 W|")],
+                     favourites=[("kitchen", "1|1|24|Fridge 150 W|"), ("kitchen", "1|2|24|Fridge 150 W|")])
+    migrate(conn)
+
+    assert conn.execute("SELECT name FROM history ORDER BY id").fetchall() == [("2024-01-01 10:00:00",),
+                                                                             ("2024-01-03 10:00:00",)]
+    assert conn.execute("SELECT id, name FROM favourite").fetchall() == [(1, "kitchen")]
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"history_data_hash", "history_name", "favourite_name"} <= indexes
+
+
+def record_rows(conn, table, record_id):
+    return conn.execute(f''' SELECT devices.name, devices.power, {table}_rows.count, {table}_rows.hours
+                             FROM {table}_rows JOIN devices ON devices.id = {table}_rows.device_id
+                             WHERE {table}_rows.{table}_id = ? ORDER BY {table}_rows.id ''', (record_id,)).fetchall()
+
+
+def test_parse_legacy_record_prefers_known_labels():
+    data = "2|1|3|TV|Living 60 W|2|5|Lamp 9 W|"
+
+    assert parse_legacy_record(data, ["TV|Living 60 W", "Lamp 9 W"]) == [("TV|Living", 60, 1, 3), ("Lamp", 9, 2, 5)]
+    with pytest.raises(ValueError):
+        parse_legacy_record(data)
+
+
+def test_record_rows_move_to_row_tables(legacy_db):
+    conn = legacy_db(devices=[("TV|Living", 60), ("Fridge", 150)],
+                     history=[("2024-01-01 10:00:00", "1|2|3|TV|Living 60 W|"),
+                              ("2024-01-02 10:00:00", "2|1|24|Fridge 150 W|1|3|TV|Living 60 W|")],
+                     favourites=[("tv", "1|2|3|TV|Living 60 W|"), ("heater", "1|1|2|Heater 2000 W|")])
+    migrate(conn)
+
+    assert record_rows(conn, "history", 1) == [("TV|Living", 60, 2, 3)]
+    assert record_rows(conn, "history", 2) == [("Fridge", 150, 1, 24), ("TV|Living", 60, 1, 3)]
+    assert record_rows(conn, "favourite", 1) == [("TV|Living", 60, 2, 3)]
+    # devices only known from a record are added
+    assert record_rows(conn, "favourite", 2) == [("Heater", 2000, 1, 2)]
+    assert conn.execute("SELECT count(*) FROM history WHERE data IS NOT NULL").fetchone() == (0,)
+
+
+def test_unreadable_records_keep_their_text(legacy_db):
+    conn = legacy_db(history=[("2024-01-01 10:00:00", "1|2|3|TV|Living 60 W|"),
+                              ("2024-01-02 10:00:00", "2|1|x|Fridge 150 W|")],
+                     favourites=[("tv", "1|2|3|TV|Living 60 W|")])
+    migrate(conn)
+
+    # neither is merged into the other or emptied
+    assert conn.execute("SELECT id, data FROM history ORDER BY id").fetchall() == [
+        (1, "1|2|3|TV|Living 60 W|"), (2, "2|1|x|Fridge 150 W|")]
+    assert conn.execute("SELECT data FROM favourite").fetchall() == [("1|2|3|TV|Living 60 W|",)]
+    assert record_rows(conn, "history", 1) == []
+
+
+def daily(conn):
+    return conn.execute("SELECT day, device_id, round(energy, 6) FROM history_daily ORDER BY day, device_id").fetchall()
+
+
+def test_daily_summary_backfill_skips_undated_history(legacy_db):
+    conn = legacy_db(devices=[("Fridge", 150)],
+                     history=[("2024-01-01 10:00:00", "1|1|24|Fridge 150 W|"), ("kitchen", "1|2|24|Fridge 150 W|")])
+    migrate(conn)
+
+    assert daily(conn) == [("2024-01-01", 1, 3.6)]
+
+
+def test_daily_summary_follows_inserts_and_deletes(tmp_path):
+    conn = create_connection(str(tmp_path / "database.db"))
+    migrate(conn)
+    fridge = create_device(conn, ("Fridge", 150))
+    tv = create_device(conn, ("TV", 50))
+    first = create_history(conn, (datetime(2024, 1, 1, 10), [(fridge, 1, 24), (tv, 1, 4)]))
+    second = create_history(conn, (datetime(2024, 1, 1, 18), [(fridge, 2, 24)]))
+    # no date to count towards, the insert still succeeds
+    assert create_history(conn, ("kitchen", [(tv, 1, 1)])) is not None
+    assert daily(conn) == [("2024-01-01", fridge, 10.8), ("2024-01-01", tv, 0.2)]
+
+    delete_history(conn, first)
+    # the TV has no energy left that day, its row goes so the device can be deleted
+    assert daily(conn) == [("2024-01-01", fridge, 7.2)]
+    delete_history(conn, second)
+    assert daily(conn) == []
+
+
+def test_import_history_with_undated_names(tmp_path):
+    conn = create_connection(str(tmp_path / "database.db"))
+    migrate(conn)
+
+    assert import_history(conn, [("kitchen", [("Fridge", 150, 1, 24)])]) == 1
+    assert daily(conn) == []
+
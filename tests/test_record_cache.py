@@ -0,0 +1,25 @@
+from record_cache import RecordCache, parse_record
+
+
+def test_invalidate_device_drops_records_using_it():
+    cache = RecordCache()
+    cache.put("history", 1, None, parse_record([(1, "Fridge", 150, 1, 24)]))
+    cache.put("favourite", 1, "Kitchen", parse_record([(1, "Fridge", 150, 1, 24), (2, "TV", 50, 1, 4)]))
+    cache.put("favourite", 2, "Living room", parse_record([(2, "TV", 50, 2, 4)]))
+
+    cache.invalidate_device(1)
+
+    assert cache.get("history", 1) is None
+    assert cache.get("favourite", 1) is None
+    assert cache.get("favourite", 2) == ("Living room", [(2, "TV", 50, 2, 4)], [0.4], 0.4)
+
+
+def test_records_with_the_same_rows_share_an_entry():
+    cache = RecordCache(max_entries=1)
+    rows = [(1, "Fridge", 150, 1, 24)]
+    cache.put("history", 1, None, parse_record(rows))
+    cache.put("favourite", 1, "Kitchen", parse_record(rows))
+    assert cache.stats()["entries"] == 1
+
+    cache.invalidate_record("favourite", 1)
+    assert cache.get("history", 1) is None
@@ -0,0 +1,22 @@
+from datetime import date
+
+from database import create_connection, migrate
+from retention import apply_retention
+from transfer import import_history
+
+
+def test_retention_keeps_undated_history(tmp_path):
+    conn = create_connection(str(tmp_path / "database.db"))
+    migrate(conn)
+    import_history(conn, [("2024-01-01 10:00:00", [("Fridge", 150, 1, 24)]),
+                          ("2024-05-30 10:00:00", [("Fridge", 150, 2, 24)]),
+                          ("(old) kitchen", [("Fridge", 150, 1, 2)]),
+                          ("#1 site", [("Fridge", 150, 1, 3)]),
+                          ("kitchen", [("Fridge", 150, 1, 4)])])
+
+    assert apply_retention(conn, keep_days=30, today=date(2024, 6, 1)) == 1
+    assert conn.execute("SELECT name FROM history ORDER BY name").fetchall() == [
+        ("#1 site",), ("(old) kitchen",), ("2024-05-30 10:00:00",), ("kitchen",)]
+    # the rolled-up entry's energy stays in the daily summary
+    assert conn.execute("SELECT day, round(energy, 6) FROM history_daily ORDER BY day").fetchall() == [
+        ("2024-01-01", 3.6), ("2024-05-30", 7.2)]
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from database import (create_connection, migrate, create_device, create_history, create_favourite, delete_history,
+                      delete_histories, delete_favourite, search_history, search_favourite)
+from retention import roll_up_history
+from sync import apply_changes
+from transfer import import_history, import_favourite
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = create_connection(str(tmp_path / "database.db"))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def favourite_change(operation, name, rows=()):
+    payload = {"name": name}
+    if operation == "insert":
+        payload["rows"] = [{"device": device, "power": power, "count": count, "hours": hours}
+                           for device, power, count, hours in rows]
+    return {"table": "favourite", "operation": operation, "payload": payload}
+
+
+def test_saved_records_are_found_by_name_and_device(conn):
+    fridge = create_device(conn, ("Fridge", 150))
+    kettle = create_device(conn, ("Kettle", 2200))
+    history_id = create_history(conn, (datetime(2024, 5, 3, 10), [(fridge, 1, 24), (kettle, 1, 1)]))
+    favourite_id = create_favourite(conn, ("Kitchen", [(kettle, 1, 1)]))
+
+    assert search_history(conn, "2024-05") == [(history_id, "2024-05-03 10:00:00")]
+    assert search_history(conn, "kett") == [(history_id, "2024-05-03 10:00:00")]
+    assert search_favourite(conn, "kitch") == [(favourite_id, "Kitchen")]
+    assert search_favourite(conn, "kettle") == [(favourite_id, "Kitchen")]
+    assert search_favourite(conn, "fridge") == []
+
+
+def test_imported_records_are_found(conn):
+    import_history(conn, [("2024-05-03 10:00:00", [("Heater", 2000, 1, 3)])])
+    import_favourite(conn, [("Living room", [("Heater", 2000, 1, 3), ("Lamp", 9, 2, 5)])])
+
+    assert [title for rowid, title in search_history(conn, "heater")] == ["2024-05-03 10:00:00"]
+    assert [title for rowid, title in search_favourite(conn, "lamp")] == ["Living room"]
+
+
+def test_synced_favourites_are_found_until_deleted(conn):
+    apply_changes(conn, [favourite_change("insert", "Garage", [("Drill", 600, 1, 1)])])
+    assert [title for rowid, title in search_favourite(conn, "drill")] == ["Garage"]
+
+    apply_changes(conn, [favourite_change("delete", "Garage")])
+    assert search_favourite(conn, "garage") == []
+
+
+def test_deleted_records_leave_the_index(conn):
+    fridge = create_device(conn, ("Fridge", 150))
+    first = create_history(conn, (datetime(2024, 1, 1, 10), [(fridge, 1, 24)]))
+    second = create_history(conn, (datetime(2024, 1, 2, 10), [(fridge, 2, 24)]))
+    create_history(conn, (datetime(2024, 1, 3, 10), [(fridge, 3, 24)]))
+    create_history(conn, (datetime(2024, 6, 1, 10), [(fridge, 4, 24)]))
+    favourite_id = create_favourite(conn, ("Kitchen", [(fridge, 1, 24)]))
+
+    delete_history(conn, first)
+    assert len(search_history(conn, "fridge")) == 3
+    delete_histories(conn, [second])
+    assert [title for rowid, title in search_history(conn, "2024-01")] == ["2024-01-03 10:00:00"]
+    roll_up_history(conn, "2024-03-01")
+    assert search_history(conn, "2024-01") == []
+    assert [title for rowid, title in search_history(conn, "fridge")] == ["2024-06-01 10:00:00"]
+
+    delete_favourite(conn, favourite_id)
+    assert search_favourite(conn, "kitchen") == []
+    # the FTS table holds no documents for records that are gone
+    assert conn.execute("SELECT count(*) FROM history_search").fetchone() == (1,)
+    assert conn.execute("SELECT count(*) FROM favourite_search").fetchone() == (0,)
@@ -0,0 +1,179 @@
+import urllib.error
+from datetime import datetime
+
+import pytest
+
+import sync as sync_module
+from database import (create_connection, migrate, create_device, create_favourite, create_history, delete_favourite,
+                      select_all_device)
+from retention import roll_up_history
+from sync import SyncServer, sync, sync_through, select_sync_state, apply_changes, pull_changes, request
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = SyncServer(str(tmp_path / "hub.db"), port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(tmp_path):
+    connections = []
+
+    def make(name):
+        conn = create_connection(str(tmp_path / f"{name}.db"))
+        migrate(conn)
+        connections.append(conn)
+        return conn
+
+    yield make
+    for conn in connections:
+        conn.close()
+
+
+def devices(conn):
+    return sorted((name, power) for device_id, name, power in select_all_device(conn))
+
+
+def favourites(conn):
+    return conn.execute(''' SELECT favourite.name, devices.name, devices.power,
+                                   favourite_rows.count, favourite_rows.hours
+                            FROM favourite
+                            JOIN favourite_rows ON favourite_rows.favourite_id = favourite.id
+                            JOIN devices ON devices.id = favourite_rows.device_id
+                            ORDER BY favourite.name, favourite_rows.id ''').fetchall()
+
+
+def change_log(conn):
+    return conn.execute("SELECT count(*) FROM change_log").fetchone()[0]
+
+
+def test_round_trip_between_two_clients(server, client):
+    a, b = client("a"), client("b")
+    fridge = create_device(a, ("Fridge", 150))
+    tv = create_device(a, ("TV", 50))
+    create_favourite(a, ("Kitchen", [(fridge, 1, 24), (tv, 2, 4)]))
+
+    assert sync(a, server.url())[:2] == (3, 0)
+    assert sync(b, server.url())[:2] == (0, 3)
+    assert devices(b) == [("Fridge", 150), ("TV", 50)]
+    assert favourites(b) == [("Kitchen", "Fridge", 150, 1, 24), ("Kitchen", "TV", 50, 2, 4)]
+    # applied changes are not logged again, so nothing goes back
+    assert change_log(b) == 0
+    assert sync(b, server.url())[:2] == (0, 0)
+
+    create_device(b, ("Oven", 2000))
+    delete_favourite(b, b.execute("SELECT id FROM favourite").fetchone()[0])
+    assert sync(b, server.url())[:2] == (2, 0)
+    sent, received, removed_devices, removed_favourites = sync(a, server.url())
+    assert (sent, received, removed_devices) == (0, 2, [])
+    assert removed_favourites == [1]
+    assert ("Oven", 2000) in devices(a)
+    assert favourites(a) == []
+
+
+def test_watermarks_advance_and_the_log_is_pruned(server, client):
+    a, b = client("a"), client("b")
+    for i in range(7):
+        create_device(a, (f"Device {i}", i))
+
+    sync_through(lambda func, *args: func(a, *args), server.url(), batch_size=3)
+    client_id, pushed_version, pulled_version = select_sync_state(a)
+    assert pushed_version == 7 and change_log(a) == 0
+    # the client's own changes count towards its pull watermark without coming back
+    assert pulled_version == 7
+
+    sync_through(lambda func, *args: func(b, *args), server.url(), batch_size=3)
+    assert select_sync_state(b)[1:] == (0, 7)
+    assert len(devices(b)) == 7
+
+    # versions keep growing after the log was emptied
+    create_device(a, ("Kettle", 2200))
+    assert a.execute("SELECT version FROM change_log").fetchone()[0] == 8
+
+
+def test_replaying_a_batch_changes_nothing(server, client):
+    a, b = client("a"), client("b")
+    create_favourite(a, ("Kitchen", [(create_device(a, ("Fridge", 150)), 1, 24)]))
+    sync(a, server.url())
+
+    hub = create_connection(server.db_file)
+    changes, version = pull_changes(hub, select_sync_state(b)[0], 0)
+    hub.close()
+    apply_changes(b, changes, version)
+    # as if the watermark had not been saved
+    apply_changes(b, changes, version)
+
+    assert devices(b) == [("Fridge", 150)]
+    assert favourites(b) == [("Kitchen", "Fridge", 150, 1, 24)]
+    assert select_sync_state(b)[2] == version
+
+
+def test_device_delete_keeps_devices_still_referenced(server, client):
+    a, b = client("a"), client("b")
+    create_device(a, ("Fridge", 150))
+    create_device(a, ("Lamp", 9))
+    sync(a, server.url())
+    sync(b, server.url())
+
+    # rolled-up history only lives on in b's daily summary, which still refers to the fridge
+    fridge, lamp = [device_id for device_id, name, power in select_all_device(b)]
+    create_history(b, (datetime(2024, 1, 1), [(fridge, 1, 24)]))
+    roll_up_history(b, "2024-06-01")
+    a.execute("DELETE FROM devices")
+    a.commit()
+    sync(a, server.url())
+
+    assert sync(b, server.url())[1:] == (2, [lamp], [])
+    assert devices(b) == [("Fridge", 150)]
+    # later syncs are not stuck on the batch
+    assert sync(b, server.url())[:2] == (0, 0)
+
+
+def test_failing_change_is_skipped(client):
+    b = client("b")
+    b.execute(''' CREATE TRIGGER reject_bad BEFORE INSERT ON devices WHEN NEW.name = 'Bad'
+                  BEGIN SELECT RAISE(ABORT, 'rejected'); END ''')
+    changes = [{"table": "devices", "operation": "insert", "payload": {"name": "Bad", "power": 1}},
+               {"table": "devices", "operation": "insert", "payload": {"name": "Good", "power": 2}}]
+
+    assert apply_changes(b, changes, 5) == (1, [], [])
+    assert devices(b) == [("Good", 2)]
+    assert select_sync_state(b)[2] == 5
+
+
+def test_malformed_changes_leave_logging_on(client):
+    b = client("b")
+    changes = [{"table": "favourite", "operation": "insert", "payload": {"name": "No rows"}},
+               {"table": "devices", "operation": "insert", "payload": {"name": "Lamp"}},
+               "not a change",
+               {"table": "devices", "operation": "insert", "payload": {"name": "TV", "power": 50}}]
+
+    assert apply_changes(b, changes)[0] == 1
+    assert b.execute("SELECT applying FROM sync_state").fetchone() == (0,)
+    create_device(b, ("Kettle", 2200))
+    assert change_log(b) == 1
+
+
+def test_apply_error_rolls_back(client, monkeypatch):
+    b = client("b")
+
+    def broken(cur, resolver, change):
+        resolver.resolve("TV", 50)
+        raise KeyError("power")
+
+    monkeypatch.setattr(sync_module, "apply_change", broken)
+    with pytest.raises(KeyError):
+        apply_changes(b, [{"table": "devices", "operation": "insert", "payload": {"name": "TV", "power": 50}}])
+    assert b.execute("SELECT applying FROM sync_state").fetchone() == (0,)
+    assert devices(b) == []
+
+
+def test_server_rejects_malformed_pushes(server):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        request(server.url(), "/push", {"client": "a", "changes": [{"table": "devices"}]})
+    assert error.value.code == 400
+
+    assert request(server.url(), "/pull?client=a&since=0") == {"changes": [], "version": 0}
@@ -0,0 +1,63 @@
+import pytest
+
+from tariff import Tariff, all_weekdays, daily_load, hourly_rates
+
+# weekday bits, Monday is bit 0 as in date.weekday()
+mon_to_fri = 0b0011111
+friday = 4
+
+
+def test_hourly_rates_band_wraps_midnight():
+    rates = hourly_rates([(22, 6, 0.1, all_weekdays)], base_rate=0.3, days=1)
+
+    night = [0, 1, 2, 3, 4, 5, 22, 23]
+    assert rates[0, night].tolist() == [0.1] * 8
+    assert rates[0, 6:22].tolist() == [0.3] * 16
+
+
+def test_hourly_rates_weekday_mask():
+    # a week starting on a Saturday
+    rates = hourly_rates([(8, 18, 0.5, mon_to_fri)], base_rate=0.2, days=7, first_weekday=5)
+
+    assert rates[:, 12].tolist() == [0.2, 0.2, 0.5, 0.5, 0.5, 0.5, 0.5]
+    assert (rates[:, :8] == 0.2).all() and (rates[:, 18:] == 0.2).all()
+
+
+def test_daily_load_wraps_past_midnight():
+    load = daily_load([1], [3], [1000], start_hour=23)
+
+    assert load[0, [23, 0, 1]].tolist() == [1, 1, 1]
+    assert load.sum() == 3
+
+
+def test_time_of_use_cost_over_a_weekend():
+    tariff = Tariff("peak", "time_of_use", rate=0.2, bands=[(8, 10, 0.5, mon_to_fri)])
+
+    # the rows draw 1 kWh at 8:00 and 9:00, and 1 kWh at 8:00, each day from Friday to Thursday: five weekdays at
+    # the peak rate and two weekend days at the base rate
+    rows, total = tariff.cost([1, 2], [2, 1], [1000, 500], days=7, start_hour=8, first_weekday=friday)
+
+    assert rows.tolist() == pytest.approx([5 * 2 * 0.5 + 2 * 2 * 0.2, 5 * 1 * 0.5 + 2 * 1 * 0.2])
+    assert total == pytest.approx(5.8 + 2.9)
+
+
+def test_tiered_cost_is_split_by_energy():
+    tariff = Tariff("steps", "tiered", tiers=[(10, 0.1), (None, 0.2)])
+
+    # 20 kWh and 10 kWh over two days: 10 kWh at 0.1 and 20 kWh at 0.2
+    rows, total = tariff.cost([1, 1], [10, 10], [1000, 500], days=2)
+
+    assert total == pytest.approx(5.0)
+    assert rows.tolist() == pytest.approx([5.0 * 2 / 3, 5.0 / 3])
+
+
+@pytest.mark.parametrize("tariff", [Tariff("flat", "flat", rate=0.3),
+                                    Tariff("steps", "tiered", tiers=[(10, 0.1), (None, 0.2)]),
+                                    Tariff("peak", "time_of_use", rate=0.2, bands=[(8, 10, 0.5, mon_to_fri)])])
+def test_empty_and_zero_consumption_cost_nothing(tariff):
+    rows, total = tariff.cost([], [], [])
+    assert rows.shape == (0,) and total == 0
+
+    rows, total = tariff.cost([1, 2], [0, 0], [100, 50])
+    # no division by the zero total
+    assert rows.tolist() == [0, 0] and total == 0
@@ -0,0 +1,20 @@
+from sqlite3 import Error
+
+import pytest
+
+from database import create_connection, migrate, create_histories, select_all_device
+from transfer import DeviceResolver
+
+
+def test_failed_import_chunk_forgets_its_devices(tmp_path):
+    conn = create_connection(str(tmp_path / "database.db"))
+    migrate(conn)
+    resolver = DeviceResolver(conn)
+
+    with pytest.raises(Error):
+        create_histories(conn, [resolver.record(("2024-01-01", [("Fridge", 150, 1, 24)])),
+                                ("2024-01-02", [(9999, 1, 1)])])
+    resolver.rolled_back()
+
+    assert resolver.device_ids == {}
+    assert select_all_device(conn) == []
@@ -0,0 +1,206 @@
+import argparse
+import csv
+import json
+import os
+from itertools import groupby, islice
+from sqlite3 import Error
+
+from database import (create_connection, migrate, select_all_device, sql_insert_device, create_devices,
+                      create_histories, create_favourites)
+
+device_fields = ["name", "power"]
+record_fields = ["name", "device", "power", "count", "hours"]
+
+
+def file_format(path, file_type=None):
+    if file_type:
+        return file_type
+    return "csv" if os.path.splitext(path)[1].lower() == ".csv" else "jsonl"
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_devices(path, file_type=None):
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format(path, file_type) == "csv":
+            for line in csv.DictReader(file):
+                yield line["name"], int(line["power"])
+        else:
+            for line in file:
+                if line.strip():
+                    device = json.loads(line)
+                    yield device["name"], int(device["power"])
+
+
+def read_records(path, file_type=None):
+    # records are (name, [(device name, power, count, hours), ...])
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format(path, file_type) == "csv":
+            # consecutive lines with the same name belong to one record
+            for name, lines in groupby(csv.DictReader(file), key=lambda line: line["name"]):
+                yield name, [(line["device"], int(line["power"]), int(line["count"]), int(line["hours"]))
+                             for line in lines]
+        else:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["name"], [(row["device"], int(row["power"]), int(row["count"]), int(row["hours"]))
+                                           for row in record["rows"]]
+
+
+class DeviceResolver:
+    def __init__(self, connection_to_db):
+        self.connection = connection_to_db
+        self.device_ids = {(device[1], device[2]): device[0] for device in select_all_device(connection_to_db)}
+        # devices added since the caller's transaction began
+        self.added = []
+
+    def resolve(self, name, power):
+        # unknown devices are added in the caller's open transaction
+        if (name, power) not in self.device_ids:
+            cur = self.connection.cursor()
+            cur.execute(sql_insert_device, (name, power))
+            self.device_ids[(name, power)] = cur.lastrowid
+            self.added.append((name, power))
+
+        return self.device_ids[(name, power)]
+
+    def committed(self):
+        self.added = []
+
+    def rolled_back(self):
+        # the devices added in the transaction are gone again
+        for device in self.added:
+            self.device_ids.pop(device, None)
+        self.added = []
+
+    def record(self, record):
+        name, rows = record
+        return name, [(self.resolve(device, power), count, hours) for device, power, count, hours in rows]
+
+
+def import_devices(connection_to_db, devices, chunk_size=1000):
+    known = {(device[1], device[2]) for device in select_all_device(connection_to_db)}
+    imported = 0
+    for chunk in chunked(devices, chunk_size):
+        # devices already in the catalog are skipped
+        new_devices = [device for device in dict.fromkeys(chunk) if device not in known]
+        known.update(new_devices)
+        if new_devices:
+            imported += create_devices(connection_to_db, new_devices)
+
+    return imported
+
+
+def import_records(connection_to_db, records, create_records, chunk_size=1000):
+    resolver = DeviceResolver(connection_to_db)
+    imported = 0
+    for chunk in chunked(records, chunk_size):
+        # each chunk, together with the devices it adds, is one transaction
+        try:
+            record_ids = create_records(connection_to_db, (resolver.record(record) for record in chunk))
+        except Error:
+            resolver.rolled_back()
+            raise
+        resolver.committed()
+        imported += sum(record_id is not None for record_id in record_ids)
+
+    return imported
+
+
+def import_history(connection_to_db, records, chunk_size=1000):
+    return import_records(connection_to_db, records, create_histories, chunk_size)
+
+
+def import_favourite(connection_to_db, records, chunk_size=1000):
+    return import_records(connection_to_db, records, create_favourites, chunk_size)
+
+
+def iterate_devices(connection_to_db):
+    cur = connection_to_db.cursor()
+    cur.execute("SELECT name, power FROM devices ORDER BY id")
+
+    return cur
+
+
+def iterate_records(connection_to_db, table):
+    cur = connection_to_db.cursor()
+    cur.execute(f''' SELECT {table}.id, {table}.name, devices.name, devices.power, rows.count, rows.hours
+                     FROM {table}
+                     LEFT JOIN {table}_rows AS rows ON rows.{table}_id = {table}.id
+                     LEFT JOIN devices ON devices.id = rows.device_id
+                     ORDER BY {table}.id, rows.id ''')
+
+    for _, lines in groupby(cur, key=lambda line: line[0]):
+        lines = list(lines)
+        yield lines[0][1], [line[2:] for line in lines if line[2] is not None]
+
+
+def export_devices(devices, path, file_type=None):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if file_format(path, file_type) == "csv":
+            writer = csv.writer(file)
+            writer.writerow(device_fields)
+            writer.writerows(devices)
+        else:
+            for name, power in devices:
+                file.write(json.dumps({"name": name, "power": power}) + "\n")
+
+
+def export_records(records, path, file_type=None):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if file_format(path, file_type) == "csv":
+            writer = csv.writer(file)
+            writer.writerow(record_fields)
+            for name, rows in records:
+                writer.writerows((name, *row) for row in rows)
+        else:
+            for name, rows in records:
+                rows = [{"device": device, "power": power, "count": count, "hours": hours}
+                        for device, power, count, hours in rows]
+                file.write(json.dumps({"name": name, "rows": rows}) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export devices, history and favourites.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("table", choices=["devices", "history", "favourite"])
+    parser.add_argument("path", help="CSV or JSONL file, picked by the .csv extension unless --format is given")
+    parser.add_argument("--format", choices=["csv", "jsonl"], dest="file_type")
+    parser.add_argument("--database", default="database.db")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    connection = create_connection(args.database)
+    if connection is None:
+        print("Error! cannot create the database connection.")
+        return 1
+    migrate(connection)
+
+    if args.action == "import":
+        if args.table == "devices":
+            count = import_devices(connection, read_devices(args.path, args.file_type), args.chunk_size)
+        elif args.table == "history":
+            count = import_history(connection, read_records(args.path, args.file_type), args.chunk_size)
+        else:
+            count = import_favourite(connection, read_records(args.path, args.file_type), args.chunk_size)
+        print(f"Imported {count} records into {args.table}")
+    else:
+        if args.table == "devices":
+            export_devices(iterate_devices(connection), args.path, args.file_type)
+        else:
+            export_records(iterate_records(connection, args.table), args.path, args.file_type)
+
+    connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
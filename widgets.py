@@ -0,0 +1,42 @@
+from kivy.uix.spinner import Spinner, SpinnerOption
+from kivy.uix.textinput import TextInput
+from kivy.core.window import Window
+
+# input widgets shared by main.py and calculation_list.py
+
+button_size = Window.size[1]/20
+max_spinner_options = 100
+
+
+class SpinnerOptions(SpinnerOption):
+    def __init__(self, **kwargs):
+        super(SpinnerOptions, self).__init__(**kwargs)
+        self.height = button_size
+
+
+class SpinnerWidget(Spinner):
+    def __init__(self, catalog=None, filter_input=None, **kwargs):
+        self.catalog = catalog
+        self.filter_input = filter_input
+        self.catalog_state = None
+        # passed to Spinner so its dropdown is built once, setting it afterwards builds it again
+        kwargs.setdefault("option_cls", SpinnerOptions)
+        super(SpinnerWidget, self).__init__(**kwargs)
+        # bound after Spinner's own handler, so it runs first and the values are fresh when it opens
+        self.fbind("on_release", self.refresh_values)
+
+    def refresh_values(self, *largs):
+        if self.catalog is None:
+            return
+        filter_text = self.filter_input.text if self.filter_input else ""
+        state = (self.catalog.version, filter_text)
+        if state != self.catalog_state:
+            self.catalog_state = state
+            self.values = self.catalog.search(filter_text, limit=max_spinner_options)
+
+
+class MyTextInput(TextInput):
+    def on_touch_down(self, touch):
+        if self.collide_point(*touch.pos) and self.text != "":
+            self.text = ""
+        return super(MyTextInput, self).on_touch_down(touch)